@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Request
 from backend.services.weather import weather_service
 from backend.services.optimizer import optimizer
+from backend.services.places_catalog import places_catalog
+from backend.services.geo_index import haversine_m, format_distance
 from backend.services.cache import cache, CACHE_TTL
 from backend.services.rate_limiter import rate_limiter
 from backend.services.metrics import metrics
@@ -8,16 +10,22 @@ from backend.services.analytics import analytics
 from backend.services.usage_counter import usage_counter
 from backend.services.tourist_memory import get_tourist_memory
 from backend.services.email_index import email_index
+from backend.services.restaurants import restaurant_repository
+from backend.services.singleflight import SingleFlight
 from fastapi.responses import HTMLResponse
 import datetime
+import math
 import time
 import os
 import uuid
 
 router = APIRouter()
 
-# Path to the data file
-DATA_FILE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "el_tigre.json")
+# Radio para "lugares cercanos" cuando el cliente envía su posición
+NEARBY_RADIUS_M = 1500
+
+# In-flight city_context computations by cache key
+city_context_flight = SingleFlight()
 
 @router.get("/restaurant/{local_id}")
 async def get_restaurant_data(local_id: str):
@@ -27,32 +35,15 @@ async def get_restaurant_data(local_id: str):
     return get_restaurant_data_internal(local_id)
 
 def get_restaurant_data_internal(local_id: str):
-    if not os.path.exists(DATA_FILE_PATH):
-        raise HTTPException(status_code=500, detail="Restaurant data file not found")
-    
-    try:
-        with open(DATA_FILE_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            
-        restaurant = data.get("restaurant")
-        if not restaurant:
-             raise HTTPException(status_code=404, detail="Restaurant data structure invalid")
-             
-        if restaurant.get("id") != local_id and local_id != "default":
-             # For this mockup, we mostly ignore the ID or support just one
-             if local_id != restaurant.get("id"):
-                 raise HTTPException(status_code=404, detail=f"Restaurant {local_id} not found")
-        
-        return restaurant
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Error decoding restaurant data")
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        # If calling from internal function, we might want to re-raise or handle differently, 
-        # but for now raising HTTPException is fine as it will be caught by FastAPI or caller can catch it.
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=500, detail=str(e))
+    # Served from memory (RestaurantRepository hot-reloads the files on change).
+    # get() first: it is what schedules the reload, also when nothing parsed at startup
+    restaurant = restaurant_repository.get(local_id)
+    if not restaurant:
+        if not len(restaurant_repository):
+            raise HTTPException(status_code=500, detail="Restaurant data file not found")
+        raise HTTPException(status_code=404, detail=f"Restaurant {local_id} not found")
+
+    return restaurant
 
 @router.get("/weather/{city}")
 async def get_weather(city: str):
@@ -269,8 +260,6 @@ async def get_city_context(request: Request):
     Tool endpoint para Alexandra Tours.
     Devuelve contexto urbano: clima, lugares cercanos, eventos, hora local.
     """
-    from backend.services.weather import weather_service
-
     try:
         body = await request.json()
     except:
@@ -292,25 +281,70 @@ async def get_city_context(request: Request):
             "upgrade_url": "https://alexandra.tours/premium"
         }
 
+    # Obtener ubicación (default Barcelona centro)
+    lat, lon = _parse_location(body)
+    has_location = lat is not None
+    if not has_location:
+        lat, lon = 41.3851, 2.1734
+    city = body.get("city", "Barcelona")
+
     # 3. Check cache
     # Solo usamos cache si NO hay mensaje especifico (contexto general)
-    cache_key = f"city_context:{body.get('city', 'Barcelona')}:{tier}"
+    cache_key = f"city_context:{city}:{tier}"
+    if has_location:
+        # ~100m buckets: nearby users share the same "lugares cercanos"
+        cache_key += f":{lat:.3f},{lon:.3f}"
     cached = cache.get(cache_key)
     if cached and not user_message:
         metrics.cache_hits += 1
-        return cached
+        return _personalize_featured(cached, user_id)
     
     if not user_message:
          metrics.cache_misses += 1
 
-    # Obtener ubicación (default Barcelona centro)
-    lat = body.get("latitude", 41.3851)
-    lon = body.get("longitude", 2.1734)
-    city = body.get("city", "Barcelona")
-    
     # Extract query for optimization
     user_query = body.get("query", body.get("user_message", ""))
 
+    args = (user_id, tier, user_message, user_query, city, lat, lon, has_location, cache_key)
+    if not user_query:
+        # Single-flight: concurrent misses of the same general context wait on
+        # one computation (which fills the cache) instead of all recomputing it
+        shared = await city_context_flight.do(cache_key, lambda: _build_city_context(*args))
+        return _personalize_featured(shared, user_id)
+    return await _build_city_context(*args)
+
+def _parse_location(body: dict):
+    """(lat, lon) from the request, or (None, None) if missing, not finite or out of range."""
+    try:
+        lat, lon = float(body["latitude"]), float(body["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return None, None  # NaN/inf would break the geo grid
+    if abs(lat) > 90 or abs(lon) > 180:
+        return None, None  # No es una coordenada real: se trata como sin ubicación
+    return lat, lon
+
+def _personalize_featured(response: dict, user_id: str) -> dict:
+    """
+    The general context is cached/shared per city and tier: the caller's
+    interests re-order its featured places per request (a copy, the cached
+    response is never mutated).
+    """
+    featured = response.get("featured_places") or []
+    interests = list(get_tourist_memory(user_id).data.preferences.interests)
+    places = [places_catalog.by_id.get(str(p.get("id"))) for p in featured]
+    if not interests or None in places:
+        return response  # No interests, or the static fallback (not catalog places)
+    by_id = {str(p.get("id")): p for p in featured}
+    boosted = [by_id[p.id] for p in optimizer.boost_interests(places, interests)]
+    if boosted == featured:
+        return response
+    return {**response, "featured_places": boosted}
+
+async def _build_city_context(user_id: str, tier: str, user_message: str, user_query: str, city: str,
+                              lat: float, lon: float, has_location: bool, cache_key: str):
+    """Full city_context pipeline (cache miss or specific message)."""
     # 1. Clima actual
     weather = await weather_service.get_weather(city)
 
@@ -334,36 +368,44 @@ async def get_city_context(request: Request):
     # Get Tier Config
     tier_config = optimizer.get_response_config(tier)
 
-    # 3. Lugares destacados (Lazy Context)
-    import json
-    import os
-    PLACES_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "barcelona_places.json")
+    # MEMORY INTEGRATION (V2)
+    # 1. Get Memory
+    memory = get_tourist_memory(user_id)
     
-    all_places = []
-    if os.path.exists(PLACES_FILE):
-        try:
-            with open(PLACES_FILE, "r", encoding="utf-8") as f:
-                places_data = json.load(f)
-                # Flatten the list for filtering
-                p_list = places_data.get("places", {})
-                for cat, items in p_list.items():
-                    for item in items:
-                        item['category'] = cat # Add category metadata
-                        all_places.append(item)
-        except Exception as e:
-            print(f"Error loading places: {e}")
-
-    featured_places = []
+    # 2. Add User Interaction (triggers learning, before ranking places)
+    if user_message:
+         memory.add_interaction("user", user_message)
+
+    # Interests boost the query ranking: if user likes "jazz", jazz places come first.
+    # The general (no query) list is shared through the cache, see _personalize_featured
+    preferred_interests = list(memory.data.preferences.interests)
+
+    # 3. Lugares destacados (Lazy Context) - catálogo precargado e indexado
+    featured = []
     
-    # Hack 3: Contexto Lazy / Hack 1: Filter
+    # Hack 3: Contexto Lazy / Hack 1: Filter (ranked top-k)
     if user_query:
-        featured_places = optimizer.filter_context(user_query, all_places)
-    else:
-        # Default if no query
-        if all_places: featured_places = all_places[:tier_config["max_places"]]
+        featured = optimizer.rank_places(user_query, places_catalog, preferred_interests)
+    elif has_location:
+        # Default if no query: lo más cercano al usuario (índice geoespacial)
+        nearby = places_catalog.nearest(lat, lon, k=tier_config["max_places"], radius_m=NEARBY_RADIUS_M)
+        featured = [p for _, p in nearby]
+    
+    if not featured and not user_query:
+        # Default if no query / nothing nearby
+        featured = places_catalog.head(tier_config["max_places"])
 
     # Enforce tier limits even on filtered results
-    featured_places = featured_places[:tier_config["max_places"]]
+    featured_places = [p.to_dict() for p in featured[:tier_config["max_places"]]]
+
+    # Distancias reales desde la posición del usuario (en vez de strings estáticos)
+    if has_location:
+        for place in featured_places:
+            coords = place.get("coordinates")
+            if coords and coords.get("lat") is not None and coords.get("lon") is not None:
+                meters = haversine_m(lat, lon, coords["lat"], coords["lon"])
+                place["distance"] = format_distance(meters)
+                place["distance_m"] = int(round(meters))
 
     # Fallback
     if not featured_places:
@@ -392,23 +434,8 @@ async def get_city_context(request: Request):
         "- TONO: Amiga local, no guía robótica. "
     )
     
-    # MEMORY INTEGRATION (V2)
-    # 1. Get Memory
-    memory = get_tourist_memory(user_id)
-    
-    # 2. Add User Interaction (triggers learning)
-    if user_message:
-         memory.add_interaction("user", user_message)
-
-    # 3. Get Context for LLM
+    # 3. Get Context for LLM (memory loaded above, before ranking places)
     memory_context = memory.get_llm_context()
-    
-    # 4. Filter Places based on Preferences (if available) -> Advanced logic for V3, basic now
-    # If user likes "jazz", prioritize "jazz" places from all_places
-    preferred_interests = memory.data.preferences.interests
-    if preferred_interests:
-         # Simple boost: move matching places to top
-         featured_places.sort(key=lambda x: any(i in str(x).lower() for i in preferred_interests), reverse=True)
 
     if tier == "free":
         brevity_rules += "- Si el usuario es FREE tier: respuestas ultra-concisas y NUNCA repitas información. "
@@ -466,15 +493,17 @@ async def get_city_context(request: Request):
 
     # Record V2 Usage Counter (Billing)
     # Cost is calculated inside record_usage if not provided, based on service type
-    usage_counter.record_usage(
-        session_id=user_id,
-        service="claude", # Main driver is the LLM logic
-        action="completion",
-        cached=False
-    )
-    
-    # Also record weather cost if we called it (approx)
-    usage_counter.record_usage(user_id, "weather", "current_weather")
+    # One batch per request: all items are persisted in a single write (off the event loop)
+    async with usage_counter.batch() as usage:
+        usage.record_usage(
+            session_id=user_id,
+            service="claude", # Main driver is the LLM logic
+            action="completion",
+            cached=False
+        )
+        
+        # Also record weather cost if we called it (approx)
+        usage.record_usage(user_id, "weather", "current_weather")
 
     # 7. Persistent Analytics Log
     analytics.record_interaction(
@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     
     # RAG
     CHROMA_DB_PATH: str = "./chroma_db"
+    RAG_MODE: str = "bm25"  # "bm25" o "vector" (hashed TF-IDF, requiere numpy)
     
     # External APIs
     GEMINI_API_KEY: str = ""
@@ -20,6 +21,17 @@ class Settings(BaseSettings):
     ELEVENLABS_AGENT_ID: str = ""
     GOOGLE_MAPS_API_KEY: str = ""
 
+    # Cache: "memory" (por worker) o "shared" (todos los workers del host)
+    CACHE_BACKEND: str = "memory"
+    CACHE_SHARED_PATH: str = ""
+
+    # Usage: group commit window across concurrent requests (0 = off)
+    USAGE_GROUP_COMMIT_MS: int = 0
+
+    # Tourist sessions: "sqlite" (un solo fichero indexado) o "json" (un fichero por sesión)
+    SESSION_STORE: str = "sqlite"
+    SESSION_STORE_PATH: str = ""
+
     # Context Settings
     DEFAULT_CITY: str = "Barcelona"
     AI_PERSONA_NAME: str = "Alexandra"
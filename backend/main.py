@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -15,10 +16,34 @@ except ImportError:
     settings = Settings()
 
 from backend.api.routes import router as api_router
+from backend.services.http_client import create_http_client
+from backend.services.weather import weather_service
+from backend.services.places import places_service
+from backend.services.usage_counter import usage_counter
+from backend.services.tourist_memory import memory_cache
+from backend.services.analytics import analytics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP client (keep-alive, timeouts) shared by the outbound services
+    http_client = create_http_client()
+    weather_service.set_http_client(http_client)
+    places_service.set_http_client(http_client)
+    usage_counter.enable_group_commit(getattr(settings, "USAGE_GROUP_COMMIT_MS", 0))
+    try:
+        yield
+    finally:
+        weather_service.set_http_client(None)
+        places_service.set_http_client(None)
+        await http_client.aclose()
+        usage_counter.close()  # Flush pending usage batches
+        memory_cache.close()  # Flush dirty tourist sessions (write-behind)
+        analytics.close()  # Write queued analytics rows
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
+    lifespan=lifespan,
 )
 
 # CORS
@@ -0,0 +1,212 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Passage size when chunking a venue story (words)
+CHUNK_WORDS = 80
+INDEX_VERSION = 1
+
+_TOKEN_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+STOPWORDS = frozenset("""
+a al algo con de del el en es esta este fue ha la las le lo los mas muy no o para pero por que se
+sin su sus un una y the of and to in is it for on with was at
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, accent-folded word tokens without stopwords."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return [t for t in _TOKEN_RE.findall(folded) if t not in STOPWORDS]
+
+
+def chunk_text(text: str, max_words: int = CHUNK_WORDS) -> List[str]:
+    """Splits a story into passages of whole sentences, about max_words each."""
+    passages, current, words = [], [], 0
+    for sentence in _SENTENCE_RE.split(text.strip()):
+        if not sentence:
+            continue
+        n = len(sentence.split())
+        if current and words + n > max_words:
+            passages.append(" ".join(current))
+            current, words = [], 0
+        current.append(sentence)
+        words += n
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring over passages.
+    Documents (venue stories) are chunked into passages; each passage keeps
+    its document's local_id so queries can be restricted to one venue.
+    Add/remove are incremental (postings and length stats updated in place),
+    and the index persists to JSON so startup does not re-tokenize.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._next_pid = 0
+        self._docs: Dict[str, Dict[str, Any]] = {}       # doc_id -> {"metadata", "passages": [pid]}
+        self._passages: Dict[int, Dict[str, Any]] = {}   # pid -> {"doc_id", "local_id", "text", "length"}
+        self._postings: Dict[str, Dict[int, int]] = {}   # term -> {pid: term frequency}
+        self._by_local: Dict[str, Set[int]] = {}         # local_id -> pids
+        self._total_length = 0
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    @property
+    def passage_count(self) -> int:
+        return len(self._passages)
+
+    def add_document(self, doc_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        """Indexes (or re-indexes) a document."""
+        metadata = dict(metadata or {})
+        local_id = metadata.get("local_id", doc_id)
+        with self._lock:
+            if doc_id in self._docs:
+                self.remove_document(doc_id)
+            pids = []
+            for passage in chunk_text(text):
+                pid = self._next_pid
+                self._next_pid += 1
+                terms = tokenize(passage)
+                self._passages[pid] = {"doc_id": doc_id, "local_id": local_id, "text": passage, "length": len(terms)}
+                for term in terms:
+                    postings = self._postings.setdefault(term, {})
+                    postings[pid] = postings.get(pid, 0) + 1
+                self._by_local.setdefault(local_id, set()).add(pid)
+                self._total_length += len(terms)
+                pids.append(pid)
+            self._docs[doc_id] = {"metadata": metadata, "passages": pids}
+            self.dirty = True
+
+    def remove_document(self, doc_id: str) -> bool:
+        with self._lock:
+            doc = self._docs.pop(doc_id, None)
+            if doc is None:
+                return False
+            for pid in doc["passages"]:
+                passage = self._passages.pop(pid)
+                for term in set(tokenize(passage["text"])):
+                    postings = self._postings.get(term)
+                    if postings is not None:
+                        postings.pop(pid, None)
+                        if not postings:
+                            del self._postings[term]
+                pids = self._by_local.get(passage["local_id"])
+                if pids is not None:
+                    pids.discard(pid)
+                    if not pids:
+                        del self._by_local[passage["local_id"]]
+                self._total_length -= passage["length"]
+            self.dirty = True
+            return True
+
+    def search(self, query_text: str, n_results: int = 1, local_id: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """Top-n passages as (score, passage), optionally only from one venue."""
+        with self._lock:
+            if local_id is not None:
+                allowed = self._by_local.get(local_id)
+                if not allowed:
+                    return []
+            else:
+                allowed = None
+            n_passages = len(self._passages)
+            if not n_passages:
+                return []
+            avg_length = self._total_length / n_passages or 1.0
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query_text or "")):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_passages - len(postings) + 0.5) / (len(postings) + 0.5))
+                # Iterate the smaller side: a venue has few passages, a term may have many
+                if allowed is not None and len(allowed) < len(postings):
+                    hits = ((pid, postings[pid]) for pid in allowed if pid in postings)
+                else:
+                    hits = ((pid, tf) for pid, tf in postings.items() if allowed is None or pid in allowed)
+                for pid, tf in hits:
+                    length = self._passages[pid]["length"]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[pid] = scores.get(pid, 0.0) + idf * tf * (self.k1 + 1) / norm
+            best = heapq.nlargest(n_results, scores.items(), key=lambda item: (item[1], -item[0]))
+            return [(score, dict(self._passages[pid], pid=pid)) for pid, score in best]
+
+    def document_passages(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Passages of one document in order."""
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            return [dict(self._passages[pid], pid=pid) for pid in doc["passages"]] if doc else []
+
+    def passages_of(self, local_id: str) -> List[Dict[str, Any]]:
+        """Passages of a venue in ingestion order."""
+        with self._lock:
+            return [dict(self._passages[pid], pid=pid) for pid in sorted(self._by_local.get(local_id, ()))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": INDEX_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "next_pid": self._next_pid,
+                "docs": self._docs,
+                "passages": self._passages,
+                "postings": self._postings,
+            }
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            payload = json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+            self.dirty = False
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """Index saved by save(), or None if missing/incompatible."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading RAG index {path}: {e}")
+            return None
+        if data.get("version") != INDEX_VERSION:
+            return None
+        index = cls(k1=data["k1"], b=data["b"])
+        index._next_pid = data["next_pid"]
+        index._docs = data["docs"]
+        index._passages = {int(pid): p for pid, p in data["passages"].items()}
+        index._postings = {term: {int(pid): tf for pid, tf in postings.items()}
+                           for term, postings in data["postings"].items()}
+        for pid, passage in index._passages.items():
+            index._by_local.setdefault(passage["local_id"], set()).add(pid)
+            index._total_length += passage["length"]
+        return index
+
+    def documents(self) -> Iterable[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return [(doc_id, dict(doc["metadata"])) for doc_id, doc in self._docs.items()]
@@ -1,12 +1,33 @@
 # import chromadb (Removed for ARM64 compatibility)
+import os
+from typing import Any, Dict, List, Optional
 from backend.core.config import get_settings
+from backend.rag.bm25 import BM25Index
+from backend.rag.vectors import NUMPY_AVAILABLE, HashedVectorIndex
 
 settings = get_settings()
 
+# Persisted BM25 index (loaded at startup instead of re-tokenizing the stories)
+RAG_INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "rag_index.json")
+# Hashed-vector index (vector mode): rag_vectors.json + rag_vectors.<gen>.f32 (memory-mapped)
+RAG_VECTORS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "rag_vectors")
+
 class RAGSystem:
-    def __init__(self):
-        # Replaced heavy ChromaDB with lightweight in-memory store for MVP/ARM64
+    def __init__(self, index_path: str = RAG_INDEX_PATH, mode: str = None, vectors_path: str = RAG_VECTORS_PATH):
+        # Replaced heavy ChromaDB with a local BM25 inverted index (pure Python, ARM64 friendly)
+        self.index_path = index_path
+        self.vectors_path = vectors_path
+        self.mode = mode or getattr(settings, "RAG_MODE", "bm25")
         self.stories = []
+        self.index = BM25Index.load(index_path) or BM25Index()
+        # Optional dense mode (RAG_MODE=vector): hashed TF-IDF vectors, needs numpy
+        self.vectors: Optional[HashedVectorIndex] = None
+        if self.mode == "vector":
+            if NUMPY_AVAILABLE:
+                self.vectors = HashedVectorIndex.load(vectors_path) or HashedVectorIndex()
+            else:
+                print("RAG vector mode needs numpy, using BM25")
+                self.mode = "bm25"
         self._initialize_data()
 
     def _initialize_data(self):
@@ -28,16 +49,70 @@ class RAGSystem:
                 "metadata": {"local_id": "el_rincon_barceloneta", "name": "El Rincón"}
             }
         ]
+        # Only stories missing from the persisted index get tokenized
+        for story in self.stories:
+            if story["id"] not in self.index:
+                self.index.add_document(story["id"], story["text"], story["metadata"])
+        if self.vectors is not None:
+            # Vector index built from the same passages (only what it lacks)
+            known = self.vectors.doc_ids()
+            missing = [p for doc_id, _ in self.index.documents() if doc_id not in known
+                       for p in self.index.document_passages(doc_id)]
+            if missing:
+                self.vectors.add(missing)
+        self.save()
+
+    def add_story(self, story_id: str, text: str, metadata: Dict[str, Any], persist: bool = True):
+        """Ingests (or replaces) a venue story. Use persist=False for bulk loads, then save()."""
+        self.index.add_document(story_id, text, metadata)
+        if self.vectors is not None:
+            self.vectors.remove_document(story_id)
+            self.vectors.add(self.index.document_passages(story_id))
+        if persist:
+            self.save()
+
+    def remove_story(self, story_id: str, persist: bool = True) -> bool:
+        removed = self.index.remove_document(story_id)
+        if self.vectors is not None:
+            self.vectors.remove_document(story_id)
+        if removed and persist:
+            self.save()
+        return removed
+
+    def save(self):
+        try:
+            if self.index.dirty:
+                self.index.save(self.index_path)
+            if self.vectors is not None and self.vectors.dirty:
+                self.vectors.save(self.vectors_path)
+        except Exception as e:
+            print(f"Error saving RAG index: {e}")
+
+    def vector_search_many(self, queries: List[str], n_results: int = 3,
+                           local_id: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """Batched cosine top-k (vector mode only)."""
+        if self.vectors is None:
+            raise RuntimeError("RAG vector mode is not enabled (RAG_MODE=vector, requires numpy)")
+        return [[dict(passage, score=round(score, 4)) for score, passage in hits]
+                for hits in self.vectors.search_many(queries, n_results, local_id)]
+
+    def search(self, query_text: str, n_results: int = 3, local_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top passages (BM25, or cosine in vector mode) with their score, local_id and document id."""
+        if self.vectors is not None:
+            hits = self.vectors.search(query_text, n_results, local_id)
+        else:
+            hits = self.index.search(query_text, n_results, local_id)
+        return [dict(passage, score=round(score, 4)) for score, passage in hits]
 
     def query(self, local_id: str, query_text: str, n_results: int = 1):
-        """Retrieve relevant context for a specific local_id (Simple substring implementation)."""
-        # Simple extraction for MVP: Just return the story if local_id matches
-        # In a real vector DB we would use embeddings.
-        
-        matches = [s["text"] for s in self.stories if s["metadata"]["local_id"] == local_id]
-        
-        if matches:
-            return matches[0]
+        """Retrieve relevant context for a specific local_id (BM25 or vector search over its passages)."""
+        hits = self.search(query_text, n_results, local_id=local_id)
+        if hits:
+            return "\n".join(passage["text"] for passage in hits)
+        # No query term matched: the venue's story as before (first passages)
+        passages = self.index.passages_of(local_id)[:n_results]
+        if passages:
+            return "\n".join(p["text"] for p in passages)
         return None
 
 # Global instance
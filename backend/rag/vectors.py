@@ -0,0 +1,315 @@
+import json
+import math
+import os
+import threading
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from backend.rag.bm25 import tokenize
+
+# Optional dependency: vector mode only if NumPy is installed (pip install numpy)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# Cross-process file lock around save (POSIX). On Windows, single writer only.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Hashing-trick dimensions (buckets). Queries only touch the buckets of their terms.
+DEFAULT_DIM = 1024
+# Spare columns allocated when the matrix grows
+GROWTH_FACTOR = 2
+# Compact removed columns on save once they exceed this fraction
+COMPACT_RATIO = 0.25
+VECTOR_INDEX_VERSION = 1
+
+
+def _bucket(term: str, dim: int) -> Tuple[int, float]:
+    """Stable (across processes) bucket and sign of a term."""
+    h = zlib.crc32(term.encode("utf-8"))
+    return h % dim, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+class HashedVectorIndex:
+    """
+    Dense-vector retrieval without a native vector DB.
+    Passages are embedded with a hashing-trick TF-IDF projection (signed
+    buckets, sublinear tf, idf fitted on the corpus at ingestion time) and
+    L2-normalized, so a dot product is the cosine similarity.
+    The matrix is stored transposed (dim x passages, float32): a query only
+    gathers the rows of its own buckets, so cost grows with the number of
+    query terms times passages, not with dim.
+    Persistence: <path>.json (passage metadata) naming a
+    <path>.<generation>.<token>.f32 matrix (raw float32, memory-mapped
+    read-only, shared by every worker through the page cache). Each save
+    writes a new, uniquely named file and then switches the JSON to it,
+    under a flock on <path>.lock, so a worker that mapped a previous
+    matrix keeps a consistent view and JSON and matrix always match.
+    """
+
+    def __init__(self, dim: int = DEFAULT_DIM):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("HashedVectorIndex requires numpy (pip install numpy)")
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((dim, 0), dtype=np.float32)  # dim x capacity
+        self._count = 0
+        self._meta: List[Optional[Dict[str, Any]]] = []     # column -> passage (None = removed)
+        self._local_codes = np.zeros(0, dtype=np.int32)     # column -> local_id code (-1 = removed)
+        self._local_ids: Dict[str, int] = {}
+        self._doc_columns: Dict[str, List[int]] = {}        # doc_id -> columns
+        self._df = Counter()                                # bucket -> passages containing it
+        self._n_docs = 0
+        self._removed = 0
+        self._generation = 0
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return self._count - self._removed
+
+    def doc_ids(self) -> set:
+        with self._lock:
+            return set(self._doc_columns)
+
+    # --- Embedding -----------------------------------------------------
+
+    def _idf(self, bucket: int) -> float:
+        return math.log((1 + self._n_docs) / (1 + self._df.get(bucket, 0))) + 1.0
+
+    def _term_weights(self, text: str) -> Dict[int, float]:
+        weights: Dict[int, float] = {}
+        for term, tf in Counter(tokenize(text)).items():
+            bucket, sign = _bucket(term, self.dim)
+            weights[bucket] = weights.get(bucket, 0.0) + sign * (1.0 + math.log(tf))
+        return weights
+
+    def _embed(self, weights: Dict[int, float]) -> Tuple[Any, Any]:
+        """Sparse normalized tf-idf vector as (buckets, values)."""
+        if not weights:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+        buckets = np.fromiter(weights.keys(), dtype=np.intp, count=len(weights))
+        values = np.fromiter((w * self._idf(b) for b, w in weights.items()), dtype=np.float32, count=len(weights))
+        norm = float(np.linalg.norm(values))
+        if norm > 0:
+            values /= norm
+        return buckets, values
+
+    # --- Ingestion -----------------------------------------------------
+
+    def _ensure_capacity(self, needed: int):
+        capacity = self._matrix.shape[1]
+        if needed <= capacity and self._matrix.flags.writeable:
+            return
+        new_capacity = max(needed, capacity * GROWTH_FACTOR, 64)
+        grown = np.zeros((self.dim, new_capacity), dtype=np.float32)
+        grown[:, :self._count] = self._matrix[:, :self._count]
+        self._matrix = grown
+        codes = np.full(new_capacity, -1, dtype=np.int32)
+        codes[:self._count] = self._local_codes[:self._count]
+        self._local_codes = codes
+
+    def add(self, passages: Sequence[Dict[str, Any]]):
+        """
+        Adds passages ({"doc_id", "local_id", "text", ...}). Document
+        frequencies are updated first, so the batch is weighted with idf
+        including itself.
+        """
+        with self._lock:
+            batch = [(p, self._term_weights(p["text"])) for p in passages]
+            for _, weights in batch:
+                self._df.update(weights.keys())
+            self._n_docs += len(batch)
+            self._ensure_capacity(self._count + len(batch))
+            for passage, weights in batch:
+                column = self._count
+                buckets, values = self._embed(weights)
+                self._matrix[buckets, column] = values
+                local_id = passage.get("local_id", passage.get("doc_id"))
+                self._local_codes[column] = self._local_ids.setdefault(local_id, len(self._local_ids))
+                self._meta.append({k: passage[k] for k in ("doc_id", "local_id", "text") if k in passage})
+                self._doc_columns.setdefault(passage.get("doc_id"), []).append(column)
+                self._count += 1
+            self.dirty = True
+
+    def remove_document(self, doc_id: str) -> int:
+        """Drops every passage of a document (columns zeroed, compacted on save)."""
+        with self._lock:
+            columns = self._doc_columns.pop(doc_id, [])
+            if columns:
+                self._ensure_capacity(self._count)  # Writable copy if memory-mapped
+            for column in columns:
+                self._matrix[:, column] = 0.0
+                self._local_codes[column] = -1
+                self._meta[column] = None
+            removed = len(columns)
+            if removed:
+                self._removed += removed
+                self.dirty = True
+            return removed
+
+    # --- Retrieval -----------------------------------------------------
+
+    def search_many(self, queries: Sequence[str], k: int = 3,
+                    local_id: Optional[str] = None) -> List[List[Tuple[float, Dict[str, Any]]]]:
+        """Batched cosine top-k: one matrix product for every query."""
+        with self._lock:
+            n = self._count
+            results: List[List[Tuple[float, Dict[str, Any]]]] = [[] for _ in queries]
+            if not n or not queries:
+                return results
+            embedded = [self._embed(self._term_weights(q)) for q in queries]
+            # Only the buckets used by some query are read from the matrix
+            used = np.unique(np.concatenate([b for b, _ in embedded]))
+            if not used.size:
+                return results
+            column_of = {int(b): i for i, b in enumerate(used)}
+            q_matrix = np.zeros((len(queries), used.size), dtype=np.float32)
+            for row, (buckets, values) in enumerate(embedded):
+                for b, v in zip(buckets, values):
+                    q_matrix[row, column_of[int(b)]] = v
+            scores = q_matrix @ self._matrix[used, :n]           # queries x passages
+            if local_id is not None:
+                code = self._local_ids.get(local_id)
+                if code is None:
+                    return results
+                scores[:, self._local_codes[:n] != code] = -np.inf
+            else:
+                scores[:, self._local_codes[:n] < 0] = -np.inf
+            top = min(k, n)
+            for row in range(len(queries)):
+                candidates = np.argpartition(-scores[row], top - 1)[:top]
+                for column in candidates[np.argsort(-scores[row, candidates], kind="stable")]:
+                    score = float(scores[row, column])
+                    if score > 0:
+                        results[row].append((score, dict(self._meta[column], column=int(column))))
+            return results
+
+    def search(self, query_text: str, k: int = 3, local_id: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        return self.search_many([query_text], k, local_id)[0]
+
+    # --- Persistence ---------------------------------------------------
+
+    def _compact(self):
+        keep = [column for column, meta in enumerate(self._meta) if meta is not None]
+        self._matrix = np.ascontiguousarray(self._matrix[:, keep])
+        self._local_codes = self._local_codes[keep]
+        self._meta = [self._meta[column] for column in keep]
+        self._count = len(keep)
+        self._removed = 0
+        self._doc_columns = self._columns_by_doc(self._meta)
+
+    @staticmethod
+    def _columns_by_doc(metas: List[Optional[Dict[str, Any]]]) -> Dict[str, List[int]]:
+        columns: Dict[str, List[int]] = {}
+        for column, meta in enumerate(metas):
+            if meta is not None:
+                columns.setdefault(meta.get("doc_id"), []).append(column)
+        return columns
+
+    @staticmethod
+    @contextmanager
+    def _file_lock(path: str):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_meta(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _matrix_path(path: str, meta: Dict[str, Any]) -> str:
+        # Files saved before unique names: <path>.<generation>.f32
+        name = meta.get("matrix") or f"{os.path.basename(path)}.{meta['generation']}.f32"
+        return os.path.join(os.path.dirname(path), name)
+
+    def save(self, path: str):
+        """Writes a new matrix file, then switches <path>.json to it (one saver at a time across workers)."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._file_lock(path):
+            try:
+                current = self._read_meta(path)
+            except (OSError, ValueError):
+                current = None
+            previous = self._matrix_path(path, current) if current and "generation" in current else None
+            with self._lock:
+                self._generation = max(self._generation, current.get("generation", 0) if current else 0) + 1
+                matrix_path = f"{path}.{self._generation}.{uuid.uuid4().hex[:12]}.f32"
+                if self._removed > COMPACT_RATIO * max(self._count, 1):
+                    self._compact()
+                matrix = np.ascontiguousarray(self._matrix[:, :self._count])
+                meta = {
+                    "version": VECTOR_INDEX_VERSION,
+                    "dim": self.dim,
+                    "count": self._count,
+                    "generation": self._generation,
+                    "matrix": os.path.basename(matrix_path),
+                    "n_docs": self._n_docs,
+                    "df": {str(b): n for b, n in self._df.items()},
+                    "local_ids": self._local_ids,
+                    "passages": self._meta,
+                }
+                self.dirty = False
+            # Never rewrite a file in place: another worker may have it memory-mapped
+            matrix.tofile(f"{matrix_path}.tmp")
+            os.replace(f"{matrix_path}.tmp", matrix_path)
+            tmp_meta = f"{path}.json.{os.getpid()}.tmp"
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_meta, f"{path}.json")
+            # Workers that mapped the superseded matrix keep it until they reload (POSIX unlink semantics)
+            if previous and previous != matrix_path and os.path.exists(previous):
+                os.remove(previous)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["HashedVectorIndex"]:
+        """Memory-maps a saved index (read-only, zero copy); None if missing/incompatible."""
+        if not NUMPY_AVAILABLE:
+            return None
+        if not os.path.exists(f"{path}.json"):
+            return None  # Never built (fresh install): no lock file, no error
+        try:
+            # Under the save lock: the matrix named by the JSON cannot be superseded and removed before it is mapped
+            with cls._file_lock(path):
+                meta = cls._read_meta(path)
+                if meta is None or meta.get("version") != VECTOR_INDEX_VERSION:
+                    return None
+                index = cls(dim=meta["dim"])
+                index._generation = meta["generation"]
+                count = meta["count"]
+                if count:
+                    index._matrix = np.memmap(cls._matrix_path(path, meta), dtype=np.float32, mode="r",
+                                              shape=(index.dim, count))
+        except (OSError, ValueError) as e:
+            print(f"Error loading vector index {path}: {e}")
+            return None
+        index._count = count
+        index._n_docs = meta["n_docs"]
+        index._df = Counter({int(b): n for b, n in meta["df"].items()})
+        index._local_ids = meta["local_ids"]
+        index._meta = meta["passages"]
+        index._removed = sum(1 for m in index._meta if m is None)
+        index._doc_columns = cls._columns_by_doc(index._meta)
+        index._local_codes = np.array(
+            [index._local_ids[m["local_id"]] if m is not None else -1 for m in index._meta], dtype=np.int32
+        )
+        return index
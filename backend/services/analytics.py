@@ -1,18 +1,264 @@
+import atexit
+import queue
 import sqlite3
+import threading
 import time
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "stats.db")
+# Background writer: one transaction per BATCH_ROWS rows or BATCH_MS, whichever comes first
+ANALYTICS_BATCH_ROWS = 500
+ANALYTICS_BATCH_MS = 200
+# Rows waiting to be written; beyond this, new rows are dropped (and counted)
+ANALYTICS_QUEUE_SIZE = 10_000
+
+INSERT_SQL = """
+    INSERT INTO requests
+    (timestamp, user_id, tier, endpoint, tokens_in, tokens_out, bypass, intent, city, language, error)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# Rollup bucket for requests_hourly
+ROLLUP_BUCKET_SECONDS = 3600
+
+ROLLUP_SCHEMA = """
+    CREATE INDEX IF NOT EXISTS idx_requests_timestamp ON requests (timestamp);
+    CREATE INDEX IF NOT EXISTS idx_requests_user ON requests (user_id);
+    CREATE TABLE IF NOT EXISTS requests_hourly (
+        hour INTEGER,
+        tier TEXT,
+        intent TEXT,
+        city TEXT,
+        requests INTEGER,
+        tokens_in INTEGER,
+        tokens_out INTEGER,
+        bypasses INTEGER,
+        PRIMARY KEY (hour, tier, intent, city)
+    );
+    CREATE TABLE IF NOT EXISTS intent_totals (
+        intent TEXT PRIMARY KEY,
+        requests INTEGER,
+        tokens_in INTEGER,
+        tokens_out INTEGER,
+        bypasses INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS request_users (
+        user_id TEXT PRIMARY KEY,
+        first_seen REAL,
+        last_seen REAL,
+        requests INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_request_users_last_seen ON request_users (last_seen);
+    CREATE TABLE IF NOT EXISTS request_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        unique_users INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS users_last_seen_hourly (
+        hour INTEGER PRIMARY KEY,
+        users INTEGER
+    );
+"""
+# SQLite variable limit when looking up a batch's users
+USER_LOOKUP_CHUNK = 500
+
+
+def _update_rollups(conn: sqlite3.Connection, rows: List[tuple]):
+    """Folds a batch of request rows into the rollup tables (caller's transaction)."""
+    hourly: Dict[tuple, List[int]] = {}
+    intents: Dict[str, List[int]] = {}
+    users: Dict[str, List[float]] = {}
+    for ts, user_id, tier, _, tokens_in, tokens_out, bypass, intent, city, _, _ in rows:
+        intent = intent or "unknown"
+        values = (1, tokens_in or 0, tokens_out or 0, 1 if bypass else 0)
+        for totals in (hourly.setdefault((int(ts // ROLLUP_BUCKET_SECONDS), tier or "", intent, city or ""), [0, 0, 0, 0]),
+                       intents.setdefault(intent, [0, 0, 0, 0])):
+            for i, v in enumerate(values):
+                totals[i] += v
+        seen = users.get(user_id)
+        if seen is None:
+            users[user_id] = [ts, ts, 1]
+        else:
+            seen[0], seen[1], seen[2] = min(seen[0], ts), max(seen[1], ts), seen[2] + 1
+    conn.executemany(
+        "INSERT INTO requests_hourly (hour, tier, intent, city, requests, tokens_in, tokens_out, bypasses) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (hour, tier, intent, city) DO UPDATE SET "
+        "requests = requests + excluded.requests, tokens_in = tokens_in + excluded.tokens_in, "
+        "tokens_out = tokens_out + excluded.tokens_out, bypasses = bypasses + excluded.bypasses",
+        [key + tuple(totals) for key, totals in hourly.items()]
+    )
+    conn.executemany(
+        "INSERT INTO intent_totals (intent, requests, tokens_in, tokens_out, bypasses) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (intent) DO UPDATE SET "
+        "requests = requests + excluded.requests, tokens_in = tokens_in + excluded.tokens_in, "
+        "tokens_out = tokens_out + excluded.tokens_out, bypasses = bypasses + excluded.bypasses",
+        [(intent,) + tuple(totals) for intent, totals in intents.items()]
+    )
+    # Running totals: unique users, and how many users have their last_seen in
+    # each hour, so the dashboard never counts request_users rows
+    previous: Dict[str, float] = {}
+    user_ids = list(users)
+    for i in range(0, len(user_ids), USER_LOOKUP_CHUNK):
+        chunk = user_ids[i:i + USER_LOOKUP_CHUNK]
+        previous.update(conn.execute(
+            f"SELECT user_id, last_seen FROM request_users WHERE user_id IN ({','.join('?' * len(chunk))})",
+            chunk
+        ).fetchall())
+    moved: Dict[int, int] = {}
+    for user_id, seen in users.items():
+        last = previous.get(user_id)
+        new_hour = int(max(seen[1], last if last is not None else seen[1]) // ROLLUP_BUCKET_SECONDS)
+        if last is not None:
+            old_hour = int(last // ROLLUP_BUCKET_SECONDS)
+            if old_hour == new_hour:
+                continue
+            moved[old_hour] = moved.get(old_hour, 0) - 1
+        moved[new_hour] = moved.get(new_hour, 0) + 1
+    new_users = len(users) - len(previous)
+    if new_users:
+        conn.execute(
+            "INSERT INTO request_totals (id, unique_users) VALUES (1, ?) "
+            "ON CONFLICT (id) DO UPDATE SET unique_users = unique_users + excluded.unique_users",
+            (new_users,)
+        )
+    conn.executemany(
+        "INSERT INTO users_last_seen_hourly (hour, users) VALUES (?, ?) "
+        "ON CONFLICT (hour) DO UPDATE SET users = users + excluded.users",
+        [(hour, delta) for hour, delta in moved.items() if delta]
+    )
+    conn.executemany(
+        "INSERT INTO request_users (user_id, first_seen, last_seen, requests) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET "
+        "first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen), "
+        "requests = requests + excluded.requests",
+        [(user_id,) + tuple(seen) for user_id, seen in users.items()]
+    )
+
+
+class AnalyticsWriter:
+    """
+    Owns the only write connection to stats.db. record_interaction just
+    enqueues a row (never blocks the request); this thread drains the queue
+    in batched transactions. When the queue is full the row is dropped and
+    counted instead of applying backpressure to a voice turn.
+    Each batch also updates the rollup tables in the same transaction, so
+    they always match the raw requests table.
+    """
+
+    def __init__(self, db_path: str, batch_rows: int = ANALYTICS_BATCH_ROWS,
+                 batch_ms: float = ANALYTICS_BATCH_MS, max_queued: int = ANALYTICS_QUEUE_SIZE):
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        self.window = batch_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queued)
+        self._stop = threading.Event()
+        self._counter_lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: tuple) -> bool:
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+            return False
+
+    def _next_batch(self) -> List[tuple]:
+        first = self._queue.get()
+        batch = [] if first is None else [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_rows and not self._stop.is_set():
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if row is not None:
+                batch.append(row)
+        return batch
+
+    def _drain(self) -> List[tuple]:
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if row is not None:
+                rows.append(row)
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]):
+        if not rows:
+            return
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(INSERT_SQL, rows)
+            _update_rollups(conn, rows)
+            conn.execute("COMMIT")
+            with self._counter_lock:
+                self.written += len(rows)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            with self._counter_lock:
+                self.failed += len(rows)
+            print(f"Analytics Error: batch of {len(rows)} rows not written: {e}")
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while not self._stop.is_set():
+                self._write(conn, self._next_batch())
+            # Shutdown: whatever is still queued, in batch_rows chunks
+            pending = self._drain()
+            for i in range(0, len(pending), self.batch_rows):
+                self._write(conn, pending[i:i + self.batch_rows])
+        finally:
+            conn.close()
+
+    def close(self, timeout: float = 5.0):
+        """Writes every queued row and stops the thread."""
+        if not self._thread.is_alive():
+            return
+        self._stop.set()
+        try:
+            self._queue.put_nowait(None)  # Wake the thread if it is idle
+        except queue.Full:
+            pass  # Not idle: it will see _stop after the current batch
+        self._thread.join(timeout=timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
 
 class AnalyticsService:
-    def __init__(self):
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._writer: Optional[AnalyticsWriter] = None
+        self._writer_lock = threading.Lock()
         self._init_db()
+        atexit.register(self.close)
 
     def _init_db(self):
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        with sqlite3.connect(DB_PATH) as conn:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            # WAL: the dashboard reads while the writer thread commits
+            conn.execute("PRAGMA journal_mode=WAL")
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS requests (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,7 +275,65 @@ class AnalyticsService:
                     error TEXT
                 )
             """)
+            conn.executescript(ROLLUP_SCHEMA)
             conn.commit()
+        self._backfill_rollups()
+
+    def _backfill_rollups(self):
+        """Databases created before the rollup tables: build them once from requests."""
+        with sqlite3.connect(self.db_path, timeout=30, isolation_level=None) as conn:
+            if conn.execute("SELECT 1 FROM request_totals LIMIT 1").fetchone():
+                return
+            if not conn.execute("SELECT 1 FROM requests LIMIT 1").fetchone():
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have done it while we waited for the lock
+                if not conn.execute("SELECT 1 FROM intent_totals LIMIT 1").fetchone():
+                    conn.execute(
+                        "INSERT INTO requests_hourly (hour, tier, intent, city, requests, tokens_in, tokens_out, bypasses) "
+                        "SELECT CAST(timestamp / ? AS INTEGER), COALESCE(tier, ''), COALESCE(intent, 'unknown'), "
+                        "COALESCE(city, ''), COUNT(*), SUM(COALESCE(tokens_in, 0)), SUM(COALESCE(tokens_out, 0)), "
+                        "SUM(CASE WHEN bypass = 1 THEN 1 ELSE 0 END) "
+                        "FROM requests GROUP BY 1, 2, 3, 4",
+                        (ROLLUP_BUCKET_SECONDS,)
+                    )
+                    conn.execute(
+                        "INSERT INTO intent_totals (intent, requests, tokens_in, tokens_out, bypasses) "
+                        "SELECT intent, SUM(requests), SUM(tokens_in), SUM(tokens_out), SUM(bypasses) "
+                        "FROM requests_hourly GROUP BY intent"
+                    )
+                    conn.execute(
+                        "INSERT INTO request_users (user_id, first_seen, last_seen, requests) "
+                        "SELECT user_id, MIN(timestamp), MAX(timestamp), COUNT(*) FROM requests GROUP BY user_id"
+                    )
+                self._backfill_user_totals(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _backfill_user_totals(conn: sqlite3.Connection):
+        """request_users built before the running totals existed: derive them once."""
+        if conn.execute("SELECT 1 FROM request_totals LIMIT 1").fetchone():
+            return
+        conn.execute("INSERT INTO request_totals (id, unique_users) SELECT 1, COUNT(*) FROM request_users")
+        conn.execute("DELETE FROM users_last_seen_hourly")
+        conn.execute(
+            "INSERT INTO users_last_seen_hourly (hour, users) "
+            "SELECT CAST(last_seen / ? AS INTEGER), COUNT(*) FROM request_users GROUP BY 1",
+            (ROLLUP_BUCKET_SECONDS,)
+        )
+
+    def _get_writer(self) -> AnalyticsWriter:
+        writer = self._writer
+        if writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = AnalyticsWriter(self.db_path)
+                writer = self._writer
+        return writer
 
     def record_interaction(self, 
                            user_id: str, 
@@ -41,21 +345,31 @@ class AnalyticsService:
                            intent: str = "unknown",
                            city: str = "unknown",
                            error: str = None):
-        """Log a single interaction to DB."""
+        """Queue a single interaction; written to DB by the background writer."""
         try:
             # Simple language detection from intent or just default
             # In a real app we'd save the detected language
             language = "es" # Default for now
             
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.execute("""
-                    INSERT INTO requests 
-                    (timestamp, user_id, tier, endpoint, tokens_in, tokens_out, bypass, intent, city, language, error)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (time.time(), user_id, tier, endpoint, tokens_in, tokens_out, bypass, intent, city, language, error))
+            self._get_writer().submit(
+                (time.time(), user_id, tier, endpoint, tokens_in, tokens_out, bypass, intent, city, language, error)
+            )
         except Exception as e:
             print(f"Analytics Error: {e}")
 
+    def close(self):
+        """Flushes queued interactions (app shutdown). A later record starts a new writer."""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+
+    def writer_stats(self) -> Dict[str, int]:
+        writer = self._writer
+        if writer is None:
+            return {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+        return writer.stats()
+
     def get_dashboard_stats(self) -> Dict[str, Any]:
         """Calculate all stats for the admin dashboard."""
         stats = {}
@@ -64,23 +378,31 @@ class AnalyticsService:
         week_ago = now - (86400 * 7)
         month_ago = now - (86400 * 30)
 
-        with sqlite3.connect(DB_PATH) as conn:
+        with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
-            # 1. USUARIOS
+            # Everything below reads the rollup tables (kept by the writer), never the raw requests
+            # 1. USUARIOS (running totals: unique count + users per last_seen hour).
+            # Active windows are summed over at most 24*30 hourly rows, so they
+            # include users last seen in the hour the window starts in.
+            total_unique = cursor.execute("SELECT unique_users FROM request_totals WHERE id = 1").fetchone()
+            active_since = "SELECT COALESCE(SUM(users), 0) FROM users_last_seen_hourly WHERE hour >= ?"
             stats["users"] = {
-                "total_unique": cursor.execute("SELECT COUNT(DISTINCT user_id) FROM requests").fetchone()[0],
-                "active_today": cursor.execute("SELECT COUNT(DISTINCT user_id) FROM requests WHERE timestamp > ?", (day_ago,)).fetchone()[0],
-                "active_week": cursor.execute("SELECT COUNT(DISTINCT user_id) FROM requests WHERE timestamp > ?", (week_ago,)).fetchone()[0],
-                "active_month": cursor.execute("SELECT COUNT(DISTINCT user_id) FROM requests WHERE timestamp > ?", (month_ago,)).fetchone()[0],
+                "total_unique": total_unique[0] if total_unique else 0,
+                "active_today": cursor.execute(active_since, (int(day_ago // ROLLUP_BUCKET_SECONDS),)).fetchone()[0],
+                "active_week": cursor.execute(active_since, (int(week_ago // ROLLUP_BUCKET_SECONDS),)).fetchone()[0],
+                "active_month": cursor.execute(active_since, (int(month_ago // ROLLUP_BUCKET_SECONDS),)).fetchone()[0],
             }
             # New vs Returning (Simplified: users seen before today vs first seen today)
             # This is complex in SQL simple, let's approximate or skip for MVP
             # Approximation: Users valid > 24h ago are returning
             
             # 2. ENGAGEMENT
-            total_reqs = cursor.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+            sums = cursor.execute(
+                "SELECT SUM(requests), SUM(tokens_in), SUM(tokens_out), SUM(bypasses) FROM intent_totals"
+            ).fetchone()
+            total_reqs = sums[0] or 0
             stats["engagement"] = {
                 "total_queries": total_reqs,
                 "avg_per_user": round(total_reqs / max(stats["users"]["total_unique"], 1), 1),
@@ -93,10 +415,9 @@ class AnalyticsService:
             COST_OUT = 0.015 / 1000
             COST_VOICE = 0.00003 * 5 # char approx per token
 
-            sums = cursor.execute("SELECT SUM(tokens_in), SUM(tokens_out), SUM(case when bypass=1 then 1 else 0 end) FROM requests").fetchone()
-            tin = sums[0] or 0
-            tout = sums[1] or 0
-            bypasses = sums[2] or 0
+            tin = sums[1] or 0
+            tout = sums[2] or 0
+            bypasses = sums[3] or 0
             
             llm_cost = (tin * COST_IN) + (tout * COST_OUT)
             voice_cost = tout * COST_VOICE
@@ -111,9 +432,27 @@ class AnalyticsService:
             }
 
             # 4. PRODUCTO / TOP INTENTS
-            top_intents = cursor.execute("SELECT intent, COUNT(*) as c FROM requests GROUP BY intent ORDER BY c DESC LIMIT 5").fetchall()
+            top_intents = cursor.execute("SELECT intent, requests FROM intent_totals ORDER BY requests DESC LIMIT 5").fetchall()
             stats["top_intents"] = [{"name": r[0], "count": r[1]} for r in top_intents]
 
+            # Last 24h by tier and city (hourly buckets)
+            since_hour = int(day_ago // ROLLUP_BUCKET_SECONDS)
+            by_tier = cursor.execute(
+                "SELECT tier, SUM(requests), SUM(bypasses) FROM requests_hourly WHERE hour >= ? GROUP BY tier",
+                (since_hour,)
+            ).fetchall()
+            top_cities = cursor.execute(
+                "SELECT city, SUM(requests) AS c FROM requests_hourly WHERE hour >= ? GROUP BY city ORDER BY c DESC LIMIT 5",
+                (since_hour,)
+            ).fetchall()
+            stats["last_24h"] = {
+                "by_tier": [{"tier": r[0], "queries": r[1], "bypasses": r[2]} for r in by_tier],
+                "top_cities": [{"name": r[0], "count": r[1]} for r in top_cities],
+            }
+
+            # Queue health of the background writer (dropped = lost under overload)
+            stats["analytics_writer"] = self.writer_stats()
+
             # 5. RETENTION (D1) 
             # Users active yesterday AND today
             # Skipping complex SQL for now to ensure speed
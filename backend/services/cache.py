@@ -1,44 +1,376 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
 import time
-from typing import Optional, Any
-import hashlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from typing import Optional, Any, Dict
+
+# Límites por defecto (dimensionar con cache.stats() en producción)
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024   # ~64 MB (aproximado)
+SWEEP_INTERVAL = 30                    # segundos entre barridos de expirados
+
+# Backend compartido: /dev/shm es memoria (tmpfs) en Linux, visible por todos los workers
+SHARED_CACHE_PATH = os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    "alexandra_cache.sqlite3"
+)
+
+
+def _approx_size(value: Any, _depth: int = 0) -> int:
+    """Tamaño aproximado en bytes (recorre dicts/listas de JSON, no exacto)."""
+    size = sys.getsizeof(value)
+    if _depth > 8:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _approx_size(k, _depth + 1) + _approx_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set)):
+        for v in value:
+            size += _approx_size(v, _depth + 1)
+    return size
+
+
+def _namespace(key: str) -> str:
+    """'city_context:Barcelona:free' -> 'city_context' (ver CACHE_TTL)."""
+    return key.split(":", 1)[0]
+
+
+class CacheBackend(ABC):
+    """
+    Almacenamiento de SmartCache. Cuenta sus propios desalojos/expirados;
+    los hits/misses los lleva SmartCache.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl_seconds: int):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Elimina las entradas expiradas. Devuelve cuántas se borraron."""
+
+    @abstractmethod
+    def usage(self) -> Dict[str, Any]:
+        """{entries, approx_bytes, max_entries, max_bytes, namespaces: {ns: {...}}}"""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Dict LRU en el proceso, acotado por entradas y bytes aproximados."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, expires, size); orden = LRU (el más reciente al final)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._ns_stats = defaultdict(lambda: {"evictions": 0, "expired": 0, "entries": 0, "bytes": 0})
+
+    def _remove(self, key: str):
+        # Caller holds the lock
+        _, _, size = self._cache.pop(key)
+        self._bytes -= size
+        ns = self._ns_stats[_namespace(key)]
+        ns["entries"] -= 1
+        ns["bytes"] -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[1] > time.time():
+                self._cache.move_to_end(key)
+                return entry[0]
+            self._remove(key)
+            self._ns_stats[_namespace(key)]["expired"] += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl_seconds: int):
+        size = _approx_size(key) + _approx_size(value)
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+            if size > self.max_bytes:
+                return  # Nunca cabría: no vaciar todo el cache por un valor
+            ns = self._ns_stats[_namespace(key)]
+            self._cache[key] = (value, time.time() + ttl_seconds, size)
+            self._bytes += size
+            ns["entries"] += 1
+            ns["bytes"] += size
+            # LRU: desalojar los menos usados hasta respetar los límites
+            while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._cache))
+                self._ns_stats[_namespace(oldest)]["evictions"] += 1
+                self._remove(oldest)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, expires, _) in self._cache.items() if expires <= now]
+            for k in expired:
+                self._remove(k)
+                self._ns_stats[_namespace(k)]["expired"] += 1
+        return len(expired)
+
+    def usage(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.max_entries,
+                "approx_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "backend": "memory",
+                "namespaces": {name: dict(ns) for name, ns in self._ns_stats.items()}
+            }
+
+
+class SharedCacheBackend(CacheBackend):
+    """
+    Cache compartido por todos los workers del host, sin servicios externos:
+    SQLite en WAL sobre /dev/shm (tmpfs). Los valores se guardan como JSON.
+    LRU aproximado: el acceso se actualiza como mucho cada TOUCH_INTERVAL
+    segundos para que los hits no escriban en cada lectura.
+    """
+
+    TOUCH_INTERVAL = 5.0
+    LIMIT_CHECK_EVERY = 64   # sets entre comprobaciones de límites (y en cada sweep)
+    # Espera máxima por el lock de SQLite: corre en el event loop, y un cache ocupado es un miss
+    BUSY_TIMEOUT = 0.25
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sets = 0
+        # Contadores de este worker (desalojos/expirados que ha hecho él)
+        self._ns_stats = defaultdict(lambda: {"evictions": 0, "expired": 0})
+        self._conn = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")  # Es un cache: la durabilidad no importa
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                ns TEXT,
+                value TEXT,
+                expires REAL,
+                size INTEGER,
+                accessed REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires, accessed FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires, accessed = row
+            if expires <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now))
+                self._ns_stats[_namespace(key)]["expired"] += 1
+                return None
+            if now - accessed > self.TOUCH_INTERVAL:
+                self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl_seconds: int):
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            print(f"Cache: value for {key} is not JSON serializable, skipping ({e})")
+            return
+        size = len(key) + len(payload)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, ns, value, expires, size, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, _namespace(key), payload, now + ttl_seconds, size, now)
+            )
+            self._sets += 1
+            if self._sets % self.LIMIT_CHECK_EVERY == 0:
+                self._enforce_limits()
+
+    def _enforce_limits(self):
+        # Caller holds the lock
+        entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append(key)
+            entries -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in victims])
+        for k in victims:
+            self._ns_stats[_namespace(k)]["evictions"] += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def sweep(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = self._conn.execute("SELECT key FROM cache WHERE expires <= ?", (now,)).fetchall()
+            self._conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+            for (k,) in expired:
+                self._ns_stats[_namespace(k)]["expired"] += 1
+            self._enforce_limits()
+        return len(expired)
+
+    def usage(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ns, COUNT(*), COALESCE(SUM(size), 0) FROM cache GROUP BY ns"
+            ).fetchall()
+            namespaces = {name: dict(ns) for name, ns in self._ns_stats.items()}
+        for name, count, size in rows:
+            namespaces.setdefault(name, {"evictions": 0, "expired": 0}).update(entries=count, bytes=size)
+        return {
+            "entries": sum(r[1] for r in rows),
+            "max_entries": self.max_entries,
+            "approx_bytes": sum(r[2] for r in rows),
+            "max_bytes": self.max_bytes,
+            "backend": "shared",
+            "path": self.path,
+            "namespaces": namespaces
+        }
+
 
 class SmartCache:
-    """In-memory cache con TTL. Escala a Redis después."""
+    """
+    Cache con TTL sobre un backend intercambiable:
+    - MemoryCacheBackend: LRU acotado en el proceso (default).
+    - SharedCacheBackend: compartido entre workers del mismo host.
+    Un barrido periódico en segundo plano elimina los expirados.
+    Escala a Redis después (otro CacheBackend).
+    """
 
-    def __init__(self):
-        self._cache = {}
+    def __init__(self, backend: CacheBackend = None, sweep_interval: float = SWEEP_INTERVAL):
+        self.backend = backend or MemoryCacheBackend()
+        self.sweep_interval = sweep_interval
         self._hits = 0
         self._misses = 0
-
-    def _hash_key(self, key: str) -> str:
-        return hashlib.md5(key.encode()).hexdigest()
+        self._errors = 0  # Fallos del backend (tratados como miss / set omitido)
+        self._ns_stats = defaultdict(lambda: {"hits": 0, "misses": 0, "sets": 0})
+        self._sweeper: Optional[threading.Thread] = None
 
     def get(self, key: str) -> Optional[Any]:
-        hashed = self._hash_key(key)
-        if hashed in self._cache:
-            entry = self._cache[hashed]
-            if entry['expires'] > time.time():
-                self._hits += 1
-                return entry['value']
-            else:
-                del self._cache[hashed]
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # Backend caído/bloqueado (DB locked, /dev/shm lleno...): cuenta como miss
+            print(f"Cache get error for {key}: {e}")
+            self._errors += 1
+            value = None
+        ns = self._ns_stats[_namespace(key)]
+        if value is not None:
+            self._hits += 1
+            ns["hits"] += 1
+            return value
         self._misses += 1
+        ns["misses"] += 1
         return None
 
     def set(self, key: str, value: Any, ttl_seconds: int = 300):
-        hashed = self._hash_key(key)
-        self._cache[hashed] = {
-            'value': value,
-            'expires': time.time() + ttl_seconds
-        }
+        self._ns_stats[_namespace(key)]["sets"] += 1
+        try:
+            self.backend.set(key, value, ttl_seconds)
+        except Exception as e:
+            print(f"Cache set error for {key}, skipped: {e}")
+            self._errors += 1
+        self._ensure_sweeper()
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            print(f"Cache delete error for {key}: {e}")
+            self._errors += 1
+
+    def sweep(self) -> int:
+        """Elimina las entradas expiradas. Devuelve cuántas se borraron."""
+        return self.backend.sweep()
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None and self.sweep_interval:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="cache-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Cache sweep error: {e}")
 
     def stats(self):
         total = self._hits + self._misses
         hit_rate = (self._hits / total * 100) if total > 0 else 0
-        return {"hits": self._hits, "misses": self._misses, "hit_rate": f"{hit_rate:.1f}%"}
+        try:
+            usage = self.backend.usage()
+        except Exception as e:
+            usage = {"backend_error": str(e)}
+        namespaces = usage.pop("namespaces", {})
+        for name, ns in list(self._ns_stats.items()):
+            ns_total = ns["hits"] + ns["misses"]
+            namespaces[name] = dict(
+                namespaces.get(name, {}), **ns,
+                hit_rate=f"{(ns['hits'] / ns_total * 100) if ns_total else 0:.1f}%"
+            )
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": f"{hit_rate:.1f}%",
+            "backend_errors": self._errors,
+            **usage,
+            "namespaces": namespaces
+        }
+
+
+def _create_backend() -> CacheBackend:
+    """CACHE_BACKEND=memory|shared (ver config/.env.example)."""
+    from backend.core.config import get_settings
+    settings = get_settings()
+    if settings.CACHE_BACKEND == "shared":
+        try:
+            return SharedCacheBackend(settings.CACHE_SHARED_PATH or SHARED_CACHE_PATH)
+        except Exception as e:
+            print(f"Shared cache unavailable ({e}), using in-memory cache")
+    return MemoryCacheBackend()
 
 # Singleton
-cache = SmartCache()
+cache = SmartCache(_create_backend())
 
 # TTLs por tipo de dato
 CACHE_TTL = {
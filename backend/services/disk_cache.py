@@ -0,0 +1,52 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Optional
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+class DiskCache:
+    """
+    Persistent key -> JSON cache with per-entry expiry (SQLite file).
+    Second tier behind SmartCache: survives restarts and deploys.
+    Blocking calls: run them with asyncio.to_thread from async code.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expires REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries(expires)")
+        self.purge_expired()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[tuple]:
+        """(value, expires) or None if missing/expired."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, ttl_seconds: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl_seconds)
+            )
+
+    def purge_expired(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),)).rowcount
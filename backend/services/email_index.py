@@ -1,41 +1,184 @@
 import json
 import os
-from typing import Optional
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Cross-process file locks (POSIX). On Windows, single-worker only.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 EMAIL_INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "email_index.json")
+# Append-only log of mappings written since the last snapshot
+EMAIL_LOG_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "email_index.log")
+EMAIL_LOCK_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "email_index.lock")
+# Fold the log into the snapshot after this many appended lines
+COMPACT_EVERY = 1000
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
 
 class EmailIndexService:
-    def __init__(self):
+    """
+    email -> session_id for premium recovery, held in memory (O(1) lookups).
+    Persistence: a JSON snapshot plus an append-only JSONL log. Each
+    save_mapping appends one line; every COMPACT_EVERY lines the log is
+    folded into the snapshot. Workers share the files: appends and
+    compaction take an exclusive flock, and each process replays the log
+    lines other workers appended (or reloads after a compaction) before
+    answering a lookup.
+    """
+
+    def __init__(self, index_path: str = EMAIL_INDEX_PATH, log_path: str = EMAIL_LOG_PATH,
+                 lock_path: str = EMAIL_LOCK_PATH):
+        self.index_path = index_path
+        self.log_path = log_path
+        self.lock_path = lock_path
+        self._lock = threading.Lock()
+        self._index: Dict[str, str] = {}
+        self._snapshot_seen = None
+        self._log_offset = 0
+        self._log_lines = 0
         self._ensure_db()
-        
+        with self._lock, self._file_lock(shared=True):
+            self._reload()
+
     def _ensure_db(self):
-        if not os.path.exists(os.path.dirname(EMAIL_INDEX_PATH)):
-            os.makedirs(os.path.dirname(EMAIL_INDEX_PATH), exist_ok=True)
-        if not os.path.exists(EMAIL_INDEX_PATH):
-            with open(EMAIL_INDEX_PATH, "w") as f:
-                json.dump({}, f)
+        if not os.path.exists(os.path.dirname(self.index_path)):
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        if not os.path.exists(self.index_path):
+            with self._file_lock(shared=False):
+                if not os.path.exists(self.index_path):
+                    self._write_snapshot({})
+
+    @contextmanager
+    def _file_lock(self, shared: bool):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _snapshot_id(self, path: str) -> Optional[tuple]:
+        # os.replace gives the snapshot a new inode on every compaction
+        try:
+            st = os.stat(path)
+            return st.st_ino, st.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _reload(self):
+        """Snapshot + full log replay (startup, or after another worker compacted)."""
+        self._snapshot_seen = self._snapshot_id(self.index_path)
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading email index: {e}")
+            data = {}
+        # Legacy file: a plain {email: session_id} dict
+        if not isinstance(data, dict):
+            data = {}
+        emails = data["emails"] if isinstance(data.get("emails"), dict) else data
+        self._index = {normalize_email(k): v for k, v in emails.items() if isinstance(v, str)}
+        self._log_offset = 0
+        self._log_lines = 0
+        self._replay_log()
+
+    def _replay_log(self):
+        """Applies log lines appended since the last read."""
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        # Only complete lines: a concurrent append may be half-written
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            try:
+                record = json.loads(line)
+                self._index[record["e"]] = record["s"]
+            except (ValueError, KeyError, TypeError):
+                continue  # Torn or foreign line
+            self._log_lines += 1
+        self._log_offset += end
 
-    def _load(self) -> dict:
+    def _pending(self) -> Optional[str]:
+        """What other workers changed since our last read: "reload", "replay" or None (two stat calls)."""
+        if self._snapshot_id(self.index_path) != self._snapshot_seen:
+            return "reload"
         try:
-            with open(EMAIL_INDEX_PATH, "r") as f:
-                return json.load(f)
-        except:
-            return {}
+            log_size = os.stat(self.log_path).st_size
+        except FileNotFoundError:
+            log_size = 0
+        if log_size < self._log_offset:
+            return "reload"  # Truncated by a compaction we have not seen yet
+        if log_size > self._log_offset:
+            return "replay"
+        return None
+
+    def _sync(self):
+        # Caller holds the file lock (shared or exclusive)
+        action = self._pending()
+        if action == "reload":
+            self._reload()
+        elif action == "replay":
+            self._replay_log()
+
+    def _catch_up(self):
+        """Picks up other workers' writes; no file lock when nothing changed."""
+        if self._pending() is not None:
+            with self._file_lock(shared=True):
+                self._sync()
 
-    def _save(self, data: dict):
+    def _write_snapshot(self, emails: Dict[str, str]):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"emails": emails}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+
+    def _compact(self):
+        # Caller holds both locks and is caught up with the log
+        self._write_snapshot(self._index)
+        with open(self.log_path, "w"):
+            pass  # Truncate
+        self._snapshot_seen = self._snapshot_id(self.index_path)
+        self._log_offset = 0
+        self._log_lines = 0
+
+    def save_mapping(self, email: str, session_id: str):
+        key = normalize_email(email)
+        line = (json.dumps({"e": key, "s": session_id}, ensure_ascii=False) + "\n").encode("utf-8")
         try:
-            with open(EMAIL_INDEX_PATH, "w") as f:
-                json.dump(data, f, indent=2)
+            with self._lock, self._file_lock(shared=False):
+                self._sync()
+                with open(self.log_path, "ab") as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())  # Payment-linked: must survive a crash
+                self._index[key] = session_id
+                self._log_offset += len(line)
+                self._log_lines += 1
+                if self._log_lines >= COMPACT_EVERY:
+                    self._compact()
         except Exception as e:
             print(f"Error saving email index: {e}")
 
-    def save_mapping(self, email: str, session_id: str):
-        data = self._load()
-        data[email] = session_id
-        self._save(data)
-        
     def get_session_id(self, email: str) -> Optional[str]:
-        data = self._load()
-        return data.get(email)
+        with self._lock:
+            self._catch_up()
+            return self._index.get(normalize_email(email))
+
+    def __len__(self) -> int:
+        return len(self._index)
 
 email_index = EmailIndexService()
@@ -0,0 +1,107 @@
+import heapq
+import math
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+EARTH_RADIUS_M = 6371008.8
+M_PER_DEG_LAT = 111320.0
+
+T = TypeVar("T")
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def format_distance(meters: float) -> str:
+    """Human readable distance for the voice agent: '350 m' / '1.2 km'."""
+    if meters < 1000:
+        return f"{int(round(meters, -1))} m"
+    return f"{meters / 1000:.1f} km"
+
+
+class GeoGridIndex(Generic[T]):
+    """
+    Uniform grid over a local equirectangular projection (city scale).
+    nearest() scans rings of cells outward from the query cell and stops as soon
+    as no unvisited cell can beat the current k-th best, so a query only
+    touches the cells around the user instead of the whole catalog.
+    """
+
+    def __init__(self, points: Iterable[Tuple[float, float, T]], cell_size_m: float = 250.0):
+        self.cell_size_m = cell_size_m
+        pts = list(points)
+        self.size = len(pts)
+        # Projection reference latitude: the middle of the dataset
+        ref_lat = sum(p[0] for p in pts) / len(pts) if pts else 0.0
+        self._m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(ref_lat))
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, T]]] = {}
+        for lat, lon, item in pts:
+            self._cells.setdefault(self._cell_of(lat, lon), []).append((lat, lon, item))
+        if self._cells:
+            xs = [c[0] for c in self._cells]
+            ys = [c[1] for c in self._cells]
+            self._bounds = (min(xs), max(xs), min(ys), max(ys))
+        else:
+            self._bounds = (0, -1, 0, -1)
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (
+            int(math.floor(lon * self._m_per_deg_lon / self.cell_size_m)),
+            int(math.floor(lat * M_PER_DEG_LAT / self.cell_size_m)),
+        )
+
+    def _ring(self, cx: int, cy: int, r: int):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield (x, cy - r)
+            yield (x, cy + r)
+        for y in range(cy - r + 1, cy + r):
+            yield (cx - r, y)
+            yield (cx + r, y)
+
+    def nearest(self, lat: float, lon: float, k: int = 5, radius_m: Optional[float] = None) -> List[Tuple[float, T]]:
+        """k nearest items within radius_m, as (distance_m, item) sorted by distance."""
+        if k <= 0 or not self._cells:
+            return []
+        cx, cy = self._cell_of(lat, lon)
+        min_x, max_x, min_y, max_y = self._bounds
+        # Rings needed to cover the whole grid from the query cell
+        max_r = max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+        if radius_m is not None:
+            max_r = min(max_r, int(math.ceil(radius_m / self.cell_size_m)) + 1)
+
+        if (2 * max_r + 1) ** 2 > 4 * self.size:
+            # Query far from the data (or sparse grid): walking rings would visit
+            # more empty cells than there are points, a plain scan is cheaper.
+            rings = [list(self._cells)]
+        else:
+            rings = (list(self._ring(cx, cy, r)) for r in range(max_r + 1))
+
+        best: List[Tuple[float, int, T]] = []  # max-heap on distance (negated)
+        seq = 0
+        for r, cells in enumerate(rings):
+            # Any point in ring r is at least (r - 1) cells away from the query
+            if r > 1:
+                ring_min = (r - 1) * self.cell_size_m * 0.99  # slack for projection error
+                if radius_m is not None and ring_min > radius_m:
+                    break
+                if len(best) == k and ring_min > -best[0][0]:
+                    break
+            for cell in cells:
+                for plat, plon, item in self._cells.get(cell, ()):
+                    d = haversine_m(lat, lon, plat, plon)
+                    if radius_m is not None and d > radius_m:
+                        continue
+                    seq += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, seq, item))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, seq, item))
+        return [(-nd, item) for nd, _, item in sorted(best, key=lambda b: (-b[0], b[1]))]
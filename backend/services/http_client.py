@@ -0,0 +1,47 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import httpx
+
+# HTTP/2 only if the optional 'h2' package is installed (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Explicit timeouts: never let an upstream hang a voice turn
+DEFAULT_TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+
+# Connection pool per upstream host (keep-alive reused across requests)
+UPSTREAM_HOSTS = {
+    "https://api.openweathermap.org": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+    "https://places.googleapis.com": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+}
+DEFAULT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=10, keepalive_expiry=30)
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Shared pooled client for outbound APIs. Created/closed in the app lifespan
+    (backend/main.py) and injected into the services.
+    """
+    mounts = {
+        host: httpx.AsyncHTTPTransport(limits=limits, http2=HTTP2_AVAILABLE, retries=1)
+        for host, limits in UPSTREAM_HOSTS.items()
+    }
+    return httpx.AsyncClient(
+        timeout=DEFAULT_TIMEOUT,
+        limits=DEFAULT_LIMITS,
+        http2=HTTP2_AVAILABLE,
+        mounts=mounts,
+    )
+
+
+@asynccontextmanager
+async def use_client(client: Optional[httpx.AsyncClient]) -> AsyncIterator[httpx.AsyncClient]:
+    """Yields the injected shared client, or a short-lived one (scripts, no lifespan)."""
+    if client is not None:
+        yield client
+        return
+    async with httpx.AsyncClient(timeout=DEFAULT_TIMEOUT) as temp_client:
+        yield temp_client
@@ -0,0 +1,115 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+@dataclass(frozen=True)
+class KeywordHit:
+    label: str
+    keyword: str
+    start: int
+    end: int
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class KeywordMatcher:
+    """
+    Multi-keyword matcher: {label: [keywords]} compiled once into an
+    Aho-Corasick automaton, so a message is scanned in a single pass
+    whatever the number of keywords, and every hit is reported.
+
+    Keywords match whole words by default (like regex \\b...\\b). Syntax:
+      "museo*"  no boundary on the right (museos, museo-bar)
+      "*plan*"  plain substring
+      "^hola*"  anchored at the start of the text
+      "^vale$"  the whole text
+    Matching is case-insensitive (keywords and text are lowercased).
+    """
+
+    def __init__(self, rules: Dict[str, Iterable[str]]):
+        # Pattern i: (label, keyword, left boundary, right boundary, anchored start, anchored end)
+        self._patterns: List[Tuple[str, str, bool, bool, bool, bool]] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for label, keywords in rules.items():
+            for keyword in keywords:
+                self._add(label, keyword)
+        self._build_fail_links()
+
+    def _add(self, label: str, spec: str):
+        keyword = spec.lower()
+        at_start = keyword.startswith("^")
+        at_end = keyword.endswith("$")
+        keyword = keyword.strip("^$")
+        left = not keyword.startswith("*")
+        right = not keyword.endswith("*")
+        keyword = keyword.strip("*")
+        if not keyword:
+            raise ValueError(f"Empty keyword for label '{label}': {spec!r}")
+
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state].append(len(self._patterns))
+        self._patterns.append((label, keyword, left, right, at_start, at_end))
+
+    def _build_fail_links(self):
+        # BFS: a node's failure link is the longest proper suffix that is also in the trie
+        queue = deque(self._goto[0].values())  # Depth 1: fail to the root
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+
+    def scan(self, text: str) -> List[KeywordHit]:
+        """Every keyword hit in text, in order of where it ends."""
+        if not text:
+            return []
+        text = text.lower()
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self._patterns
+        n = len(text)
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            end = i + 1
+            for p in out[state]:
+                label, keyword, left, right, at_start, at_end = patterns[p]
+                start = end - len(keyword)
+                if at_start and start != 0:
+                    continue
+                if at_end and end != n:
+                    continue
+                if left and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if right and end < n and _is_word_char(text[end]):
+                    continue
+                hits.append(KeywordHit(label, keyword, start, end))
+        return hits
+
+    def labels(self, text: str) -> Set[str]:
+        """Labels with at least one hit in text."""
+        return {hit.label for hit in self.scan(text)}
+
+    def __len__(self) -> int:
+        return len(self._patterns)
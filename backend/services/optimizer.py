@@ -1,5 +1,48 @@
+import heapq
 import re
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterable
+from backend.services.intent_classifier import IntentClassifier
+from backend.services.keyword_matcher import KeywordMatcher
+from backend.services.places_catalog import Place, PlacesCatalog, tokenize
+
+# Place categories for rank_places (KeywordMatcher syntax: whole words, "*" = any suffix)
+CONTEXT_CATEGORIES = {
+    "comida": ["restaurante*", "tapas", "food", "eat", "cena*", "dinner", "lunch", "hambre"],
+    "arte": ["museo*", "arte", "museum*", "art", "cultura*", "history"],
+    "aire_libre": ["parque*", "playa*", "park*", "beach*", "walk", "caminar"],
+    "noche": ["bar", "bares", "club*", "copas", "drink*", "party", "fiesta*"]
+}
+
+# TouristMemory interests -> place tokens that satisfy them
+INTEREST_KEYWORDS = {
+    "art": ["museo*", "museum*", "arte", "art", "gallery", "galería"],
+    "history": ["historia", "history", "gótico", "gothic", "históric*"],
+    "music": ["jazz", "música", "music", "concierto*", "live"],
+    "nightlife": ["bar", "bares", "club*", "cocktail*", "copas", "nightlife"],
+    "beach": ["playa*", "beach*"],
+}
+
+# Place ranking weights (rank_places)
+CATEGORY_WEIGHT = 3.0   # per active query category the place belongs to
+QUERY_TOKEN_WEIGHT = 1.0  # per query word found in the place's name, type or best_for
+INTEREST_WEIGHT = 1.5   # per tourist interest the place satisfies
+BEST_FOR_WEIGHT = 1.0   # per best_for tag named by the query (interest tags count in INTEREST_WEIGHT)
+
+# Query words too common to rank places on (ES/EN function words and generic
+# request words: "mejor", "son", "best"... appear in tips of unrelated places)
+QUERY_STOPWORDS = frozenset("""
+al algo algun alguna algunas alguno algunos ante antes aqui aquí asi así aun bien buen buena buenas
+bueno buenos cerca como cómo con cual cuál cuales cuáles cuando cuándo cuanto cuánto del desde donde
+dónde durante ella ellas ellos entre era eres esa esas ese eso esos esta está estan están estar este
+esto estos estoy hace hacer hay hoy las les los mas más mejor mejores mis muy nada nos nosotros otra
+otras otro otros para pero poco por porque puedo puede que qué quien quién quiero recomienda
+recomiendas recomendar recomiendame recomiéndame sea ser sin sobre son sus tal tambien también
+tan tengo tiene todo todos una uno unos unas usted vamos ver voy
+about after all also any are around best better but can could did does for from get good great
+have her here him his how its just like many more most near nice not now one our out please
+recommend should some something than that the their them then there these they this those too
+very want was what when where which who why will with would you your
+""".split())
 
 class TokenOptimizer:
     """
@@ -10,14 +53,21 @@ class TokenOptimizer:
     """
     
     def __init__(self):
-        # Regex patterns for lightweight classification
+        # Keyword rules for lightweight classification (same semantics as the
+        # former regexes: "^x*" = text starts with x, "^x$" = text is exactly x).
+        # Dict order is the priority order.
         self.patterns = {
-            "greeting": r"^(hola|hi|hello|buenos|buenas|hey|bonjour|ciao)",
-            "confirm": r"^(si|yes|ok|vale|genial|perfecto|sure|yep|da|oui)$",
-            "deny": r"^(no|nope|nan|non)$",
-            "repeat": r"^(repite|repeat|como|pardon|what)$",
-            "gratitude": r"^(gracias|thanks|merci|danke|grazie)"
+            "greeting": ["^hola*", "^hi*", "^hello*", "^buenos*", "^buenas*", "^hey*", "^bonjour*", "^ciao*"],
+            "confirm": ["^si$", "^yes$", "^ok$", "^vale$", "^genial$", "^perfecto$", "^sure$", "^yep$", "^da$", "^oui$"],
+            "deny": ["^no$", "^nope$", "^nan$", "^non$"],
+            "repeat": ["^repite$", "^repeat$", "^como$", "^pardon$", "^what$"],
+            "gratitude": ["^gracias*", "^thanks*", "^merci*", "^danke*", "^grazie*"]
         }
+        # High Cost keywords: planning, multi-day, comparison, deep history (substrings)
+        self.high_cost_keywords = ["itinerario", "plan", "ruta", "dias", "comparar", "historia", "diferencia", "mejor opcion", "days", "trip"]
+        # Compiled once at startup
+        self.classifier = IntentClassifier(self.patterns, self.high_cost_keywords)
+        self.context_matcher = KeywordMatcher(CONTEXT_CATEGORIES)
         
         # Pre-computed responses (Templates) - Multi-language support could be better, 
         # but for hack/MVP we provide simple universal or Spanish defaults (User request implies Spanish base but multilingual support)
@@ -44,23 +94,16 @@ class TokenOptimizer:
         Hack 5: Clasificación ligera Regex
         Updates for V2: distinguish 'medium' vs 'high' cost
         """
-        for intent, pattern in self.patterns.items():
-            if re.search(pattern, text, re.IGNORECASE):
-                # These are all "Low Cost" (Cheap) -> Bypass
-                return intent
-        
-        # Heuristic for Medium vs High Cost
-        # High Cost keywords: planning, multi-day, comparison, deep history
-        high_cost_keywords = ["itinerario", "plan", "ruta", "dias", "comparar", "historia", "diferencia", "mejor opcion", "days", "trip"]
-        if any(k in text.lower() for k in high_cost_keywords):
-            return "high_cost"
-            
-        # High Cost by length (long complex questions)
-        if len(text.split()) > 15:
-            return "high_cost"
-            
-        # Default to Medium Cost (Simple questions)
-        return "medium_cost"
+        return self.classifier.classify(text)
+
+    def classify_many(self, texts: List[str], normalize: bool = True) -> List[str]:
+        """
+        Batch classification (offline replays of logged messages).
+        normalize=True applies normalize_input first, as get_optimized_response does.
+        """
+        if normalize:
+            texts = [self.normalize_input(t) for t in texts]
+        return self.classifier.classify_many(texts)
 
     def get_optimized_response(self, text: str, last_response: str = "") -> Dict[str, Any]:
         """
@@ -128,53 +171,72 @@ class TokenOptimizer:
             "suggested_response": None
         }
 
-    def filter_context(self, user_query: str, all_places: List[Dict]) -> List[Dict]:
+    def rank_places(self, user_query: str, catalog: PlacesCatalog,
+                    interests: Iterable[str] = (), k: int = 3) -> List[Place]:
         """
         Hack 3: Contexto Lazy.
-        Filtra la lista de lugares basada en keywords del query.
+        Top-k places for a query. Only places reached through the catalog
+        token indexes are scored (precomputed token sets, no string building;
+        query words only match name/type/best_for, never tips), then a heap
+        picks the k best (ties keep file order).
         """
-        query = user_query.lower()
-        
-        # Keywords mapping
-        categories = {
-            "comida": ["restaurante", "tapas", "food", "eat", "cena", "dinner", "lunch", "hambre"],
-            "arte": ["museo", "arte", "museum", "art", "cultura", "history"],
-            "aire_libre": ["parque", "playa", "park", "beach", "walk", "caminar"],
-            "noche": ["bar", "club", "copas", "drink", "party", "fiesta"]
-        }
-        
-        # Determine relevant categories
-        active_categories = []
-        for cat, keywords in categories.items():
-            if any(k in query for k in keywords):
-                active_categories.append(cat)
-                
-        if not active_categories:
+        # Determine relevant categories (one keyword scan, whole words:
+        # "bar" no longer matches "barcelona")
+        found = self.context_matcher.labels(user_query)
+        active_categories = [cat for cat in CONTEXT_CATEGORIES if cat in found]
+        query_tokens = {t for t in tokenize(user_query) if len(t) > 2 and t not in QUERY_STOPWORDS}
+        interests = [i for i in interests if i in INTEREST_KEYWORDS]
+
+        scores: Dict[int, float] = {}
+        places: Dict[int, Place] = {}
+
+        def add(hits, weight: float):
+            for p in hits:
+                scores[p.position] = scores.get(p.position, 0.0) + weight
+                places[p.position] = p
+
+        for cat in active_categories:
+            # Each category counts once per place, whichever of its keywords matched
+            add({p.position: p for spec in CONTEXT_CATEGORIES[cat] for p in catalog.matching_token(spec)}.values(),
+                CATEGORY_WEIGHT)
+        for token in query_tokens:
+            add(catalog.matching_name_token(token), QUERY_TOKEN_WEIGHT)
+        for tag in query_tokens:
+            add(catalog.get_by_tag(tag), BEST_FOR_WEIGHT)
+
+        if not scores:
             # Hack 11: Degradación gradual / Default
-            # Keep the list short (top 3 mixed)
-            return all_places[:3] 
-            
-        # Filter
-        filtered = []
-        for p in all_places:
-            # This assumes 'type' in place matches our categories or we do fuzzy match
-            # For this MVP, we look for matches in the 'type' or 'name' or 'tip' of the place
-            p_str = (str(p.get("type")) + str(p.get("name")) + str(p.get("tip"))).lower()
-            
-            # Check if place matches any active category keyword
-            is_match = False
-            for cat in active_categories:
-                for k in categories[cat]:
-                    if k in p_str:
-                        is_match = True
-                        break
-                if is_match: break
-            
-            if is_match:
-                filtered.append(p)
-                
-        # Hack 1: Limit results to save tokens
-        return filtered[:3]
+            # Keep the list short (top k mixed, interests first)
+            return self.boost_interests(catalog.head(k), interests)
+
+        # Interests only re-rank what the query found
+        for pos, p in places.items():
+            scores[pos] += INTEREST_WEIGHT * self._interest_hits(p, interests)
+
+        # Hack 1: Limit results to save tokens (heap top-k over the candidates)
+        best = heapq.nsmallest(k, scores, key=lambda pos: (-scores[pos], pos))
+        return [places[pos] for pos in best]
+
+    def _interest_hits(self, place: Place, interests: Iterable[str]) -> int:
+        hits = 0
+        for interest in interests:
+            for spec in INTEREST_KEYWORDS.get(interest, ()):
+                if spec.endswith("*"):
+                    prefix = spec[:-1]
+                    matched = any(t.startswith(prefix) for t in place.tokens)
+                else:
+                    matched = spec in place.tokens
+                if matched or interest in place.best_for:
+                    hits += 1
+                    break
+        return hits
+
+    def boost_interests(self, places: List[Place], interests: Iterable[str]) -> List[Place]:
+        """Stable re-order: places matching more of the tourist's interests first."""
+        interests = [i for i in interests if i in INTEREST_KEYWORDS]
+        if not interests:
+            return list(places)
+        return sorted(places, key=lambda p: -self._interest_hits(p, interests))
 
     def get_response_config(self, tier: str = "free") -> dict:
         """Configura respuesta según tier."""
@@ -1,14 +1,33 @@
+import asyncio
+import os
+import time
+import unicodedata
 import httpx
 from backend.core.config import get_settings
+from backend.services.cache import cache, CACHE_TTL
+from backend.services.disk_cache import DiskCache, DATA_DIR
+from backend.services.http_client import use_client
+from backend.services.singleflight import SingleFlight
 from typing import List, Dict, Any, Optional
 
 settings = get_settings()
 
+PLACES_CACHE_PATH = os.path.join(DATA_DIR, "places_cache.db")
+# Empty answers are cached for less time (a new place may appear)
+PLACES_NEGATIVE_TTL = 600
+
 class PlacesService:
     def __init__(self):
         self.api_key = settings.GOOGLE_MAPS_API_KEY
         self.base_url = "https://places.googleapis.com/v1/places:searchText"
-        
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.disk_cache = DiskCache(PLACES_CACHE_PATH)
+        self._flight = SingleFlight()
+
+    def set_http_client(self, client: Optional[httpx.AsyncClient]):
+        """Injects the shared pooled client (app lifespan)."""
+        self.http_client = client
+
     async def get_recommendations(self, city: str, context: str = "food", limit: int = 3) -> List[Dict[str, Any]]:
         """
         Get curated recommendations using Google Places API (New).
@@ -18,6 +37,46 @@ class PlacesService:
             print("⚠️ No Google Maps API Key found. Using mock data.")
             return []
 
+        key = self._cache_key(city, context, limit)
+
+        # Tier 1: memory (SmartCache)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["results"]
+
+        # Tier 2: disk (survives restarts/deploys) -> promote to memory
+        stored = await asyncio.to_thread(self.disk_cache.get, key)
+        if stored is not None:
+            entry, expires = stored
+            cache.set(key, entry, max(1, int(expires - time.time())))
+            return entry["results"]
+
+        # Paid call: concurrent misses for the same search share it
+        return await self._flight.do(key, lambda: self._fetch_and_store(key, city, context, limit))
+
+    def _cache_key(self, city: str, context: str, limit: int) -> str:
+        """places:{city}:{context}:{limit}, normalized ('  Tapas ' == 'tapas')."""
+        def norm(text: str) -> str:
+            return " ".join(unicodedata.normalize("NFKC", str(text)).lower().split())
+        return f"places:{norm(city)}:{norm(context)}:{int(limit)}"
+
+    async def _fetch_and_store(self, key: str, city: str, context: str, limit: int) -> List[Dict[str, Any]]:
+        results = await self._search(city, context, limit)
+        if results is None:
+            return []  # Upstream error: answer empty but don't cache it
+
+        # Negative caching: an empty answer is cached too, for less time
+        ttl = CACHE_TTL["places"] if results else PLACES_NEGATIVE_TTL
+        entry = {"results": results}
+        cache.set(key, entry, ttl)
+        try:
+            await asyncio.to_thread(self.disk_cache.set, key, entry, ttl)
+        except Exception as e:
+            print(f"Error saving places cache: {e}")
+        return results
+
+    async def _search(self, city: str, context: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Google Places text search. None on error (vs [] = no results)."""
         search_query = f"{context} in {city}"
         
         # Field mask: what data we want back to save cost/latency
@@ -37,12 +96,12 @@ class PlacesService:
                 "rankPreference": "RELEVANCE" 
             }
 
-            async with httpx.AsyncClient() as client:
+            async with use_client(self.http_client) as client:
                 response = await client.post(self.base_url, json=body, headers=headers, timeout=10.0)
                 
                 if response.status_code != 200:
                     print(f"Google Places Error: {response.text}")
-                    return []
+                    return None
 
                 data = response.json()
                 places = data.get("places", [])
@@ -73,7 +132,7 @@ class PlacesService:
 
         except Exception as e:
             print(f"Error fetching places: {e}")
-            return []
+            return None
 
 # Singleton
 places_service = PlacesService()
@@ -0,0 +1,139 @@
+import copy
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+from backend.services.geo_index import GeoGridIndex
+
+PLACES_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "barcelona_places.json")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    """Lowercased word tokens of a text."""
+    return frozenset(_TOKEN_RE.findall(text.lower())) if text else frozenset()
+
+
+@dataclass(frozen=True)
+class Place:
+    """Immutable place record. Use to_dict() to hand out a mutable copy."""
+    position: int               # Order in the source file (stable ranking tie-break)
+    id: str
+    name: str
+    category: str               # Top-level group in the JSON: restaurants, attractions...
+    type: Optional[str]
+    neighborhood: Optional[str]
+    best_for: Tuple[str, ...]
+    tokens: FrozenSet[str]      # Word tokens of type, name, tip, neighborhood and best_for (ranking)
+    name_tokens: FrozenSet[str]  # Word tokens of type, name and best_for only (free query words)
+    lat: Optional[float]
+    lon: Optional[float]
+    raw: Mapping[str, Any] = field(repr=False, compare=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return copy.deepcopy(dict(self.raw))
+
+
+class PlacesCatalog:
+    """
+    Places loaded once at startup, with prebuilt indexes.
+    Records are immutable: requests never parse the JSON nor mutate shared data.
+    """
+
+    def __init__(self, city: str = "", places: Iterable[Place] = ()):
+        self.city = city
+        self.places: Tuple[Place, ...] = tuple(places)
+        self.by_tag = self._build_index(lambda p: p.best_for)
+        self.by_token = self._build_index(lambda p: p.tokens)
+        self.by_name_token = self._build_index(lambda p: p.name_tokens)
+        self.by_id: Mapping[str, Place] = MappingProxyType({p.id: p for p in self.places})
+        self.geo = GeoGridIndex((p.lat, p.lon, p) for p in self.places if p.lat is not None and p.lon is not None)
+        # prefix spec ("museo*") -> places with a matching token (filled lazily; only the
+        # fixed category specs end in "*", so this stays bounded whatever users send)
+        self._prefix_index: Dict[str, Tuple[Place, ...]] = {}
+
+    @classmethod
+    def load(cls, path: str = PLACES_FILE) -> "PlacesCatalog":
+        if not os.path.exists(path):
+            print(f"Places file not found: {path}")
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading places: {e}")
+            return cls()
+        return cls.from_dict(data)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PlacesCatalog":
+        places = []
+        for cat, items in data.get("places", {}).items():
+            for item in items:
+                record = dict(item)
+                record["category"] = cat  # Category metadata, added once on load
+                coords = record.get("coordinates") or {}
+                places.append(Place(
+                    position=len(places),
+                    id=str(record.get("id", f"{cat}_{len(places)}")),
+                    name=str(record.get("name", "")),
+                    category=cat,
+                    type=record.get("type"),
+                    neighborhood=record.get("neighborhood"),
+                    best_for=tuple(str(t).lower() for t in record.get("best_for", [])),
+                    tokens=tokenize(" ".join(str(record.get(k) or "") for k in ("type", "name", "tip", "neighborhood"))
+                                    + " " + " ".join(str(t) for t in record.get("best_for", []))),
+                    name_tokens=tokenize(" ".join(str(record.get(k) or "") for k in ("type", "name"))
+                                         + " " + " ".join(str(t) for t in record.get("best_for", []))),
+                    lat=coords.get("lat"),
+                    lon=coords.get("lon"),
+                    raw=MappingProxyType(record)
+                ))
+        return cls(city=data.get("city", ""), places=places)
+
+    def _build_index(self, keys_of) -> Mapping[str, Tuple[Place, ...]]:
+        index: Dict[str, List[Place]] = {}
+        for p in self.places:
+            for key in keys_of(p):
+                index.setdefault(str(key).lower(), []).append(p)
+        return MappingProxyType({k: tuple(v) for k, v in index.items()})
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def head(self, n: int) -> List[Place]:
+        return list(self.places[:n])
+
+    def get_by_tag(self, tag: str) -> Tuple[Place, ...]:
+        return self.by_tag.get(tag.lower(), ())
+
+    def nearest(self, lat: float, lon: float, k: int = 5, radius_m: Optional[float] = None) -> List[Tuple[float, Place]]:
+        """k nearest places (with coordinates) within radius_m, as (distance_m, place)."""
+        return self.geo.nearest(lat, lon, k=k, radius_m=radius_m)
+
+    def matching_name_token(self, token: str) -> Tuple[Place, ...]:
+        """Places whose type, name or best_for has the word (not tips: free query words)."""
+        return self.by_name_token.get(token.lower(), ())
+
+    def matching_token(self, spec: str) -> Tuple[Place, ...]:
+        """
+        Places having the token (whole word). A trailing "*" matches any
+        token with that prefix ("museo*" -> museo, museos). File order.
+        """
+        if not spec.endswith("*"):
+            return self.by_token.get(spec.lower(), ())
+        hits = self._prefix_index.get(spec)
+        if hits is None:
+            word = spec.rstrip("*").lower()
+            positions = {p.position: p for token, places in self.by_token.items()
+                         if token.startswith(word) for p in places}
+            hits = tuple(positions[pos] for pos in sorted(positions))
+            self._prefix_index[spec] = hits
+        return hits
+
+
+# Singleton, loaded at import (startup)
+places_catalog = PlacesCatalog.load()
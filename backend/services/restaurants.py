@@ -0,0 +1,115 @@
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+# Pilot restaurant (legacy location) + one file per venue in data/restaurants/
+RESTAURANT_SOURCES = [
+    os.path.join(DATA_DIR, "el_tigre.json"),
+    os.path.join(DATA_DIR, "restaurants", "*.json"),
+]
+
+# How often (seconds) we stat the files to look for changes
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+class RestaurantRepository:
+    """
+    Restaurant data keyed by local_id, served from memory.
+    Files are parsed once; changes are detected by (mtime, size) and reloaded
+    in a background thread, then swapped in atomically (requests keep reading
+    the previous snapshot meanwhile). Returned dicts are shared: read-only.
+    """
+
+    def __init__(self, sources: List[str] = None, check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.sources = sources if sources is not None else RESTAURANT_SOURCES
+        self.check_interval = check_interval
+        # (restaurants by id, default id) swapped as a single reference
+        self._snapshot: Tuple[Dict[str, Dict[str, Any]], Optional[str]] = ({}, None)
+        # path -> ((mtime_ns, size), restaurant dicts parsed from it)
+        self._files: Dict[str, Tuple[Tuple[int, int], List[Dict[str, Any]]]] = {}
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    def _paths(self) -> List[str]:
+        paths = []
+        for src in self.sources:
+            paths.extend(sorted(glob.glob(src)) if any(c in src for c in "*?[") else [src])
+        return paths
+
+    def _parse(self, path: str) -> List[Dict[str, Any]]:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        # Either {"restaurant": {...}} or {"restaurants": [{...}, ...]}
+        items = data.get("restaurants") or [data.get("restaurant")]
+        return [r for r in items if isinstance(r, dict) and r.get("id")]
+
+    def reload(self) -> bool:
+        """Re-reads changed/new files and swaps the snapshot. Returns True if anything changed."""
+        with self._reload_lock:
+            self._last_check = time.monotonic()
+            files = {}
+            changed = False
+            for path in self._paths():
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                sig = (st.st_mtime_ns, st.st_size)
+                previous = self._files.get(path)
+                if previous and previous[0] == sig:
+                    files[path] = previous
+                    continue
+                try:
+                    files[path] = (sig, self._parse(path))
+                    changed = True
+                except Exception as e:
+                    # Keep serving the last good version of a half-written/broken file
+                    print(f"Error loading restaurant data {path}: {e}")
+                    if previous:
+                        files[path] = previous
+            if set(files) != set(self._files):
+                changed = True
+            if not changed:
+                return False
+
+            restaurants = {}
+            default_id = None
+            for _, items in files.values():
+                for r in items:
+                    restaurants.setdefault(r["id"], r)
+                    default_id = default_id or r["id"]
+            # Atomic swap: readers see either the old or the new snapshot
+            self._files = files
+            self._snapshot = (restaurants, default_id)
+            return True
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._last_check < self.check_interval:
+            return
+        if self._reload_lock.locked():
+            return  # A reload is already running
+        self._last_check = time.monotonic()
+        threading.Thread(target=self.reload, daemon=True).start()
+
+    def get(self, local_id: str) -> Optional[Dict[str, Any]]:
+        """Restaurant by local_id ('default' = pilot restaurant). None if unknown."""
+        self._maybe_reload()
+        restaurants, default_id = self._snapshot
+        if local_id == "default":
+            local_id = default_id
+        return restaurants.get(local_id)
+
+    def ids(self) -> List[str]:
+        return list(self._snapshot[0])
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+
+
+# Singleton, loaded at import (startup)
+restaurant_repository = RestaurantRepository()
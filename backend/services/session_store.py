@@ -0,0 +1,294 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Cross-process file lock for the JSON layout (POSIX). On Windows, single worker only.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+SESSIONS_DB_PATH = os.path.join(DATA_DIR, "sessions.db")
+# Rows per transaction when importing legacy sessions/*.json
+MIGRATION_CHUNK = 500
+
+
+class SessionStore(ABC):
+    """
+    Persistence of tourist sessions (TouristMemory), as plain dicts keyed by
+    session_id. last_interaction (ISO string) drives GDPR expiry.
+    Every save bumps a per-session version (0 = not stored). Passing
+    expected_version makes the save a compare-and-swap, so a worker holding
+    a stale copy cannot overwrite what another worker wrote.
+    """
+
+    def load(self, session_id: str) -> Optional[dict]:
+        return self.load_versioned(session_id)[0]
+
+    @abstractmethod
+    def load_versioned(self, session_id: str) -> Tuple[Optional[dict], int]:
+        """(data, version), or (None, 0) if the session is not stored."""
+
+    def version(self, session_id: str) -> int:
+        """Current version of a session (0 if not stored)."""
+        return self.load_versioned(session_id)[1]
+
+    @abstractmethod
+    def save(self, session_id: str, data: dict, expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        Writes the session and returns its new version. With expected_version,
+        only if the stored version still matches; None on conflict.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def iter_sessions(self) -> Iterator[dict]:
+        """Every stored session, streamed (never all in memory)."""
+
+    @abstractmethod
+    def iter_inactive(self, before: str) -> Iterator[str]:
+        """session_ids whose last_interaction is older than before (ISO)."""
+
+    def purge_inactive(self, before: str) -> List[str]:
+        """GDPR sweep: deletes sessions inactive since before. Returns their session_ids."""
+        session_ids = list(self.iter_inactive(before))
+        for session_id in session_ids:
+            self.delete(session_id)
+        return session_ids
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+
+class JsonDirSessionStore(SessionStore):
+    """Legacy layout: one pretty-printed JSON file per session in a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_versioned(self, session_id: str) -> Tuple[Optional[dict], int]:
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return None, 0
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data, data.pop("_version", 0)
+
+    def save(self, session_id: str, data: dict, expected_version: Optional[int] = None) -> Optional[int]:
+        path = self._path(session_id)
+        # pid + thread: forked workers can share the main thread ident
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._file_lock():
+            current = self.version(session_id)
+            if expected_version is not None and current != expected_version:
+                return None
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(dict(data, _version=current + 1), f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)  # Atomic: readers never see a half-written file
+        return current + 1
+
+    def delete(self, session_id: str):
+        path = self._path(session_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _iter_files(self) -> Iterator[Tuple[str, dict]]:
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json") or not entry.is_file():
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    data.pop("_version", None)
+                    yield entry.name[:-5], data
+                except (OSError, ValueError) as e:
+                    print(f"Error reading session file {entry.name}: {e}")
+
+    def iter_sessions(self) -> Iterator[dict]:
+        for _, data in self._iter_files():
+            yield data
+
+    def iter_inactive(self, before: str) -> Iterator[str]:
+        # Full scan: this layout has no index
+        for session_id, data in self._iter_files():
+            if data.get("last_interaction", data.get("created_at", "")) < before:
+                yield session_id
+
+    def count(self) -> int:
+        with os.scandir(self.directory) as entries:
+            return sum(1 for entry in entries if entry.name.endswith(".json"))
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    All sessions in one SQLite file (WAL): O(1) load/save by primary key,
+    no per-session inode, and an index on last_interaction so expiry
+    sweeps read only the expired rows.
+    """
+
+    def __init__(self, path: str = SESSIONS_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tourist_sessions (
+                session_id TEXT PRIMARY KEY,
+                last_interaction TEXT,
+                data TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tourist_sessions)")}
+        if "version" not in columns:
+            # Stores created before compare-and-swap saves
+            self._conn.execute("ALTER TABLE tourist_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tourist_sessions_last ON tourist_sessions(last_interaction)"
+        )
+
+    @staticmethod
+    def _row(session_id: str, data: dict) -> Tuple[str, str, str]:
+        return (session_id, data.get("last_interaction", data.get("created_at", "")),
+                json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
+    def load_versioned(self, session_id: str) -> Tuple[Optional[dict], int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version FROM tourist_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM tourist_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def save(self, session_id: str, data: dict, expected_version: Optional[int] = None) -> Optional[int]:
+        session_id, last_interaction, blob = self._row(session_id, data)
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                row = self._conn.execute(
+                    "SELECT version FROM tourist_sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                current = row[0] if row else 0
+                if expected_version is not None and current != expected_version:
+                    return None
+                self._conn.execute(
+                    "INSERT INTO tourist_sessions (session_id, last_interaction, data, version) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET "
+                    "last_interaction = excluded.last_interaction, data = excluded.data, version = excluded.version",
+                    (session_id, last_interaction, blob, current + 1)
+                )
+                return current + 1
+
+    def import_many(self, sessions: Iterable[Tuple[str, dict]]) -> int:
+        """Bulk insert in one transaction. Existing sessions are kept (they are newer)."""
+        rows: List[Tuple[str, str, str]] = [self._row(sid, data) for sid, data in sessions]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO tourist_sessions (session_id, last_interaction, data) VALUES (?, ?, ?)",
+                    rows
+                )
+                return self._conn.total_changes - before
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM tourist_sessions WHERE session_id = ?", (session_id,))
+
+    def _iter_query(self, sql: str, params: tuple = ()) -> Iterator[tuple]:
+        # Paged by rowid so the lock is never held while the caller iterates
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"{sql} AND rowid > ? ORDER BY rowid LIMIT {MIGRATION_CHUNK}", params + (last_rowid,)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[1:]
+            last_rowid = rows[-1][0]
+
+    def iter_sessions(self) -> Iterator[dict]:
+        for (data,) in self._iter_query("SELECT rowid, data FROM tourist_sessions WHERE 1"):
+            yield json.loads(data)
+
+    def iter_inactive(self, before: str) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM tourist_sessions WHERE last_interaction < ?", (before,)
+            ).fetchall()
+        for (session_id,) in rows:
+            yield session_id
+
+    def purge_inactive(self, before: str) -> List[str]:
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                session_ids = [row[0] for row in self._conn.execute(
+                    "SELECT session_id FROM tourist_sessions WHERE last_interaction < ?", (before,)
+                )]
+                self._conn.execute("DELETE FROM tourist_sessions WHERE last_interaction < ?", (before,))
+        return session_ids
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tourist_sessions").fetchone()[0]
+
+
+def migrate_json_sessions(store: SqliteSessionStore, directory: str) -> int:
+    """
+    Streams legacy sessions/*.json into the store, MIGRATION_CHUNK files per
+    transaction, then renames the directory to <dir>.migrated. Safe to
+    re-run after a crash: sessions already in the store are not overwritten.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    legacy = JsonDirSessionStore(directory)
+    imported = 0
+    chunk: List[Tuple[str, dict]] = []
+    for session_id, data in legacy._iter_files():
+        chunk.append((session_id, data))
+        if len(chunk) >= MIGRATION_CHUNK:
+            imported += store.import_many(chunk)
+            chunk = []
+    if chunk:
+        imported += store.import_many(chunk)
+    os.replace(directory, directory.rstrip(os.sep) + ".migrated")
+    print(f"Sessions: migrated {imported} sessions from {directory}")
+    return imported
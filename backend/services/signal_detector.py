@@ -1,34 +1,37 @@
-import re
 from backend.services.conversation_state import ConversationState
+from backend.services.keyword_matcher import KeywordMatcher
 
-# Regex patterns for rapid detection
+# Keywords for rapid detection (whole words, accent variants spelled out)
 PATTERNS = {
     "asked_for_bill": [
-        r"\bcuenta\b", r"\bpagar\b", r"\bcobrar\b", r"\bcu(á|a)nto es\b", r"\bdolorosa\b"
+        "cuenta", "pagar", "cobrar", "cuánto es", "cuanto es", "dolorosa"
     ],
     "mentioned_hurry": [
-        r"\bprisa\b", r"\br(á|a)pido\b", r"\birnos\b", r"\btiempo\b"
+        "prisa", "rápido", "rapido", "irnos", "tiempo"
     ],
     "mentioned_celebration": [
-        r"\bcumplea(ñ|n)os\b", r"\baniversario\b", r"\bcelebrar\b", r"\bespecial\b"
+        "cumpleaños", "cumpleanos", "aniversario", "celebrar", "especial"
     ],
     "dietary_vegetarian": [
-        r"\bvegetariano\b", r"\bcarne\b", r"\bvegano\b"
+        "vegetariano", "carne", "vegano"
     ],
     "budget_sensitive": [
-        r"\bbarato\b", r"\becon(ó|o)mico\b", r"\bprecio\b", r"\bcuesta\b"
+        "barato", "económico", "economico", "precio", "cuesta"
     ],
     "wants_recommendation": [
-        r"\brecomienda(s|n)\b", r"\bsugiere(s|n)\b", r"\bbueno\b", r"\bespecialidad\b"
+        "recomiendas", "recomiendan", "sugieres", "sugieren", "bueno", "especialidad"
     ],
     "praise": [
-        r"\bbuen(í|i)simo\b", r"\bincre(í|i)ble\b", r"\bdelicioso\b", r"\bespectacular\b"
+        "buenísimo", "buenisimo", "increíble", "increible", "delicioso", "espectacular"
     ],
     "complaint": [
-        r"\bfr(í|i)o\b", r"\btarda\b", r"\bmal\b", r"\bfe(o|a)\b"
+        "frío", "frio", "tarda", "mal", "feo", "fea"
     ]
 }
 
+# Compiled once: every signal in a single pass over the message
+SIGNAL_MATCHER = KeywordMatcher(PATTERNS)
+
 def detect_signals(text: str, state: ConversationState) -> ConversationState:
     """
     Analyzes user input text and updates the state signals.
@@ -36,11 +39,11 @@ def detect_signals(text: str, state: ConversationState) -> ConversationState:
     if not text:
         return state
         
-    text_lower = text.lower()
+    found = SIGNAL_MATCHER.labels(text)
     
-    # helper for regex check
+    # helper for signal check
     def check(key):
-        return any(re.search(p, text_lower) for p in PATTERNS[key])
+        return key in found
 
     if check("asked_for_bill"):
         state.signals.asked_for_bill = True
@@ -0,0 +1,34 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller starts the
+    computation, everyone arriving while it runs awaits that same result
+    (or exception) instead of repeating the work.
+    The computation runs as its own task, so a cancelled caller (client
+    disconnect) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
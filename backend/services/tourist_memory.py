@@ -1,10 +1,68 @@
-import json
+import atexit
 import os
+import threading
 import time
-from typing import List, Dict, Optional
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, field, asdict
+from backend.services.keyword_matcher import KeywordMatcher
+from backend.services.session_store import (
+    SESSIONS_DB_PATH, JsonDirSessionStore, SessionStore, SqliteSessionStore, migrate_json_sessions
+)
 
+# Legacy one-file-per-session layout (SESSION_STORE=json), migrated into sessions.db otherwise
 SESSIONS_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "sessions")
+# Live sessions kept in memory (least recently used evicted, flushed first)
+MAX_CACHED_MEMORIES = 1000
+# Write-behind: dirty sessions are persisted at most once per interval
+SESSION_FLUSH_INTERVAL = 2.0
+# Reload-and-replay attempts when another worker saved the session first
+FLUSH_CONFLICT_RETRIES = 3
+# Interactions kept verbatim; older ones are folded into context_summary
+MAX_RECENT_INTERACTIONS = 20
+# Rolling summary limits
+SUMMARY_MAX_TOPICS = 5
+SUMMARY_MAX_REQUESTS = 3
+
+# Topic rules for the rolling summary (topic -> keywords in user messages)
+SUMMARY_TOPICS = {
+    "comida": ["restaurante*", "comer", "cenar", "tapas", "desayun*"],
+    "arte": ["museo*", "arte"],
+    "historia": ["historia", "catedral"],
+    "arquitectura": ["gaudí", "gaudi"],
+    "música": ["jazz", "música", "musica", "concierto*"],
+    "noche": ["fiesta*", "copas", "discoteca*"],
+    "playa": ["playa*"],
+    "clima": ["tiempo", "lluvia"],
+    "transporte": ["metro", "taxi", "llegar"],
+    "compras": ["compras", "tienda*", "mercado*"],
+}
+
+# Preference learning rules (label -> keywords, see KeywordMatcher syntax)
+PREFERENCE_RULES = {
+    "food:vegan": ["vegan*"],
+    "food:vegetarian": ["vegetarian*"],
+    "food:meat": ["carne*"],
+    "negation": ["no"],
+    "interest:art": ["arte", "artes", "museo*"],
+    "interest:history": ["histori*", "antigu*"],
+    "interest:music": ["jazz", "música", "musica"],
+    "interest:nightlife": ["fiesta*", "copas"],
+    "interest:beach": ["playa*"],
+    "trip:family": ["niños", "niño", "familia*"],
+    "trip:couple": ["pareja", "novio*", "novia*"],
+    "trip:group": ["amigo*", "amiga*", "grupo*"],
+    "price:low": ["barat*", "económic*", "economic*"],
+    "price:high": ["lujo*", "caro", "caros"],
+}
+# Interests in the order they are added to the profile
+INTEREST_ORDER = ["art", "history", "music", "nightlife", "beach"]
+
+# Compiled once: one pass over each message for preferences and summary topics
+MESSAGE_MATCHER = KeywordMatcher({
+    **PREFERENCE_RULES,
+    **{f"topic:{topic}": keywords for topic, keywords in SUMMARY_TOPICS.items()},
+})
 
 @dataclass
 class TouristPreferences:
@@ -37,6 +95,8 @@ class SessionData:
     interactions: List[Interaction] = field(default_factory=list)
     places_discussed: Dict[str, PlaceStatus] = field(default_factory=dict)
     context_summary: str = ""
+    # Counters behind context_summary: {"turns", "topics": {topic: n}, "requests": [...]}
+    summary_state: Dict = field(default_factory=dict)
 
 class TouristMemory:
     """
@@ -44,73 +104,139 @@ class TouristMemory:
     Replaces the ephemeral conversation_state.
     """
     
-    def __init__(self, session_id: str):
+    def __init__(self, session_id: str, write_behind: bool = False):
         self.session_id = session_id
-        self.file_path = os.path.join(SESSIONS_DIR, f"{session_id}.json")
+        # Guards self.data: concurrent turns of the same session and the flusher thread
+        self.lock = threading.RLock()
+        # With write_behind, save() only marks the session dirty and
+        # TouristMemoryCache persists it (coalesced) in the background
+        self.write_behind = write_behind
+        self.dirty = False
+        self._flush_lock = threading.Lock()  # One write at a time: an older snapshot never lands last
+        # Store version self.data is based on, and the changes made since (replayed on conflict)
+        self.version = 0
+        self._pending: List[Tuple[str, tuple]] = []
         self.data = self._load()
+        if self._trim_interactions():
+            self.dirty = True  # Long legacy history: shrink it on the next write
 
     def _load(self) -> SessionData:
-        """Loads session data from JSON or creates new."""
-        if not os.path.exists(SESSIONS_DIR):
-            os.makedirs(SESSIONS_DIR, exist_ok=True)
-            
-        if os.path.exists(self.file_path):
+        """Loads session data from the session store or creates new."""
+        try:
+            raw, self.version = session_store.load_versioned(self.session_id)
+        except Exception as e:
+            print(f"Error loading session {self.session_id}: {e}")
+            raw = None
+
+        if raw is not None:
             try:
-                with open(self.file_path, 'r', encoding='utf-8') as f:
-                    raw = json.load(f)
-                    # Reconstruct objects
-                    prefs = TouristPreferences(**raw.get("preferences", {}))
-                    interactions = [Interaction(**i) for i in raw.get("interactions", [])]
-                    places = {k: PlaceStatus(**v) for k, v in raw.get("places_discussed", {}).items()}
-                    
-                    return SessionData(
-                        session_id=raw["session_id"],
-                        created_at=raw["created_at"],
-                        last_interaction=raw.get("last_interaction", raw["created_at"]),
-                        tier=raw.get("tier", "free"),
-                        email=raw.get("email"),
-                        preferences=prefs,
-                        interactions=interactions,
-                        places_discussed=places,
-                        context_summary=raw.get("context_summary", "")
-                    )
-            except Exception as e:
-                print(f"Error loading session {self.session_id}: {e}")
-                import datetime
+                # Reconstruct objects
+                prefs = TouristPreferences(**raw.get("preferences", {}))
+                interactions = [Interaction(**i) for i in raw.get("interactions", [])]
+                places = {k: PlaceStatus(**v) for k, v in raw.get("places_discussed", {}).items()}
+
                 return SessionData(
-                    session_id=self.session_id,
-                    created_at=datetime.datetime.now().isoformat(),
-                    last_interaction=datetime.datetime.now().isoformat()
+                    session_id=raw["session_id"],
+                    created_at=raw["created_at"],
+                    last_interaction=raw.get("last_interaction", raw["created_at"]),
+                    tier=raw.get("tier", "free"),
+                    email=raw.get("email"),
+                    preferences=prefs,
+                    interactions=interactions,
+                    places_discussed=places,
+                    context_summary=raw.get("context_summary", ""),
+                    summary_state=raw.get("summary_state", {})
                 )
-        else:
-            import datetime
-            return SessionData(
-                session_id=self.session_id,
-                created_at=datetime.datetime.now().isoformat(),
-                last_interaction=datetime.datetime.now().isoformat()
-            )
+            except Exception as e:
+                print(f"Error loading session {self.session_id}: {e}")
+
+        import datetime
+        return SessionData(
+            session_id=self.session_id,
+            created_at=datetime.datetime.now().isoformat(),
+            last_interaction=datetime.datetime.now().isoformat()
+        )
+
+    def _change(self, op: str, *args):
+        """Applies a change to self.data and remembers it until it is persisted."""
+        with self.lock:
+            getattr(self, f"_apply_{op}")(*args)
+            self._pending.append((op, args))
+        self.save()
+
+    def _rebase(self):
+        """Reloads the stored state (another worker wrote it) and replays our unsaved changes on top."""
+        with self.lock:
+            self.data = self._load()
+            self._trim_interactions()
+            for op, args in self._pending:
+                getattr(self, f"_apply_{op}")(*args)
+
+    def refresh(self):
+        """Picks up writes from other workers (one version lookup when nothing changed)."""
+        try:
+            version = session_store.version(self.session_id)
+        except Exception as e:
+            print(f"Error checking session {self.session_id}: {e}")
+            return
+        if version != self.version:
+            self._rebase()
 
     def set_email(self, email: str):
         """Associates an email with the session."""
+        self._change("email", email)
+
+    def _apply_email(self, email: str):
         self.data.email = email
-        self.save()
 
     def set_tier(self, tier: str):
         """Updates the tier (e.g. to premium)."""
+        self._change("tier", tier)
+
+    def _apply_tier(self, tier: str):
         self.data.tier = tier
-        self.save()
 
     def save(self):
-        """Persists current state to JSON."""
-        try:
-            import datetime
+        """Persists current state to the session store (or marks it dirty, in write-behind mode)."""
+        import datetime
+        with self.lock:
             self.data.last_interaction = datetime.datetime.now().isoformat()
-            
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                # Convert dataclass to dict using asdict
-                json.dump(asdict(self.data), f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error saving session {self.session_id}: {e}")
+            self.dirty = True
+        if not self.write_behind:
+            self.flush()
+
+    def flush(self) -> bool:
+        """
+        Writes the session if dirty. Returns True if it was written.
+        Compare-and-swap on the store version: if another worker saved the
+        session meanwhile, its state is reloaded, our pending changes are
+        replayed on top and the write is retried.
+        """
+        with self._flush_lock:
+            for _ in range(FLUSH_CONFLICT_RETRIES):
+                with self.lock:
+                    if not self.dirty:
+                        return False
+                    # Snapshot under the lock, write outside it
+                    snapshot = asdict(self.data)
+                    expected, applied = self.version, len(self._pending)
+                    self.dirty = False
+                try:
+                    version = session_store.save(self.session_id, snapshot, expected_version=expected)
+                except Exception as e:
+                    print(f"Error saving session {self.session_id}: {e}")
+                    with self.lock:
+                        self.dirty = True  # Retry on the next flush
+                    return False
+                with self.lock:
+                    if version is not None:
+                        self.version = version
+                        del self._pending[:applied]
+                        return True
+                    self._rebase()
+                    self.dirty = True
+            print(f"Error saving session {self.session_id}: version conflict, retrying on the next flush")
+            return False
 
     def add_interaction(self, role: str, content: str, intent: str = None):
         """Adds a message and triggers learning."""
@@ -120,63 +246,104 @@ class TouristMemory:
             content=content,
             intent=intent
         )
+        self._change("interaction", interaction)
+
+    def _apply_interaction(self, interaction: Interaction):
         self.data.interactions.append(interaction)
-        
+        self._trim_interactions()
+
         # Only learn from user messages
-        if role == "user":
-            self._learn_from_message(content)
-            
-        self.save()
+        if interaction.role == "user":
+            self._learn_from_message(interaction.content)
+
+    def _trim_interactions(self) -> bool:
+        """Keeps the last MAX_RECENT_INTERACTIONS, absorbing older ones into the summary."""
+        interactions = self.data.interactions
+        overflow = len(interactions) - MAX_RECENT_INTERACTIONS
+        if overflow <= 0:
+            return False
+        for interaction in interactions[:overflow]:
+            self._absorb(interaction)
+        del interactions[:overflow]
+        self.data.context_summary = self._render_summary()
+        return True
+
+    def _absorb(self, interaction: Interaction):
+        """Folds one evicted turn into summary_state (constant size)."""
+        state = self.data.summary_state
+        state["turns"] = state.get("turns", 0) + 1
+        if interaction.role != "user":
+            return
+        topics = state.setdefault("topics", {})
+        for label in MESSAGE_MATCHER.labels(interaction.content):
+            if label.startswith("topic:"):
+                topic = label[len("topic:"):]
+                topics[topic] = topics.get(topic, 0) + 1
+        if len(topics) > 2 * SUMMARY_MAX_TOPICS:
+            # Bound the state: drop the least mentioned topics
+            for topic in sorted(topics, key=topics.get)[:len(topics) - 2 * SUMMARY_MAX_TOPICS]:
+                del topics[topic]
+        requests = state.setdefault("requests", [])
+        requests.append(interaction.content[:80])
+        del requests[:-SUMMARY_MAX_REQUESTS]
+
+    def _render_summary(self) -> str:
+        state = self.data.summary_state
+        summary = f"{state.get('turns', 0)} turnos anteriores."
+        topics = state.get("topics", {})
+        if topics:
+            top = sorted(topics.items(), key=lambda t: (-t[1], t[0]))[:SUMMARY_MAX_TOPICS]
+            summary += " Temas: " + ", ".join(f"{topic} ({n})" for topic, n in top) + "."
+        if state.get("requests"):
+            summary += " Últimas peticiones: " + "; ".join(f"'{r}'" for r in state["requests"]) + "."
+        return summary
 
     def _learn_from_message(self, content: str):
-        """Simple rule-based NLP to extract preferences."""
-        content = content.lower()
-        
+        """Simple rule-based NLP to extract preferences (single keyword scan)."""
+        found = MESSAGE_MATCHER.labels(content)
+        prefs = self.data.preferences
+
         # Food Preferences
-        if "vegano" in content or "vegana" in content:
-            if "vegan" not in self.data.preferences.food_types:
-                self.data.preferences.food_types.append("vegan")
-        if "vegetariano" in content:
-            if "vegetarian" not in self.data.preferences.food_types:
-                self.data.preferences.food_types.append("vegetarian")
-        if "carne" in content and "no" not in content: # Risky heuristic
-             if "meat" not in self.data.preferences.food_types:
-                self.data.preferences.food_types.append("meat")
+        if "food:vegan" in found and "vegan" not in prefs.food_types:
+            prefs.food_types.append("vegan")
+        if "food:vegetarian" in found and "vegetarian" not in prefs.food_types:
+            prefs.food_types.append("vegetarian")
+        if "food:meat" in found and "negation" not in found: # Risky heuristic
+            if "meat" not in prefs.food_types:
+                prefs.food_types.append("meat")
 
         # Interests
-        interests_map = {
-            "arte": "art", "museo": "art", "historia": "history", 
-            "antiguo": "history", "jazz": "music", "música": "music",
-            "fiesta": "nightlife", "copas": "nightlife", "playa": "beach"
-        }
-        for kw, val in interests_map.items():
-            if kw in content and val not in self.data.preferences.interests:
-                self.data.preferences.interests.append(val)
+        for val in INTEREST_ORDER:
+            if f"interest:{val}" in found and val not in prefs.interests:
+                prefs.interests.append(val)
 
         # Trip Type
-        if "niños" in content or "familia" in content:
-            self.data.preferences.trip_type = "family"
-        elif "pareja" in content or "novio" in content or "novia" in content:
-            self.data.preferences.trip_type = "couple"
-        elif "amigos" in content or "grupo" in content:
-            self.data.preferences.trip_type = "group"
-            
+        if "trip:family" in found:
+            prefs.trip_type = "family"
+        elif "trip:couple" in found:
+            prefs.trip_type = "couple"
+        elif "trip:group" in found:
+            prefs.trip_type = "group"
+
         # Price
-        if "barato" in content or "económico" in content:
-            self.data.preferences.price_range = "low"
-        elif "lujo" in content or "caro" in content:
-            self.data.preferences.price_range = "high"
+        if "price:low" in found:
+            prefs.price_range = "low"
+        elif "price:high" in found:
+            prefs.price_range = "high"
 
     def update_place_status(self, place_name: str, status: str):
         """Updates status of a place (recommended, visited, rejected)."""
-        self.data.places_discussed[place_name] = PlaceStatus(
-            status=status,
-            timestamp=time.time()
-        )
-        self.save()
+        self._change("place_status", place_name, PlaceStatus(status=status, timestamp=time.time()))
+
+    def _apply_place_status(self, place_name: str, status: PlaceStatus):
+        self.data.places_discussed[place_name] = status
 
     def get_llm_context(self) -> str:
         """Builds a concise context string for the LLM."""
+        with self.lock:
+            return self._build_llm_context()
+
+    def _build_llm_context(self) -> str:
         p = self.data.preferences
         
         # Profile Section
@@ -186,8 +353,10 @@ class TouristMemory:
 - Intereses: {', '.join(p.interests) if p.interests else 'Aún no definidos'}
 - Comida: {', '.join(p.food_types) if p.food_types else 'Sin restricciones'}"""
 
-        # History Section (Last 5 turns to save tokens)
+        # History Section (Last 5 turns to save tokens, older turns summarized)
         history = "[HISTORIAL RECIENTE]"
+        if self.data.context_summary:
+            history = f"[RESUMEN ANTERIOR]\n{self.data.context_summary}\n\n{history}"
         recent = self.data.interactions[-5:] 
         for i in recent:
             history += f"\n{i.role.capitalize()}: {i.content[:100]}..." # Truncate long msgs
@@ -203,9 +372,125 @@ class TouristMemory:
         return f"{profile}\n\n{places}\n\n{history}"
         
     def delete_session(self):
-        """GDPR: Deletes the session file."""
-        if os.path.exists(self.file_path):
-            os.remove(self.file_path)
+        """GDPR: Deletes the stored session."""
+        with self.lock:
+            self.forget()
+            memory_cache.discard(self.session_id)
+            session_store.delete(self.session_id)
+
+    def forget(self):
+        """Drops unsaved changes: the session was deleted and must not be written back."""
+        with self.lock:
+            self.dirty = False
+            self._pending.clear()
+
+
+class TouristMemoryCache:
+    """
+    LRU of live TouristMemory objects: one instance per session in the
+    process, so a turn no longer re-reads and re-parses the JSON file and
+    concurrent turns share (and lock) the same object.
+    Saves are write-behind: a background thread flushes dirty sessions every
+    flush_interval seconds (several saves in one turn -> one write), evicted
+    sessions are flushed before leaving, and close() flushes everything.
+    Safe with several workers: get() revalidates the cached copy against the
+    store version and saves are compare-and-swap (see TouristMemory.flush).
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_MEMORIES, flush_interval: float = SESSION_FLUSH_INTERVAL):
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._memories: "OrderedDict[str, TouristMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        atexit.register(self.close)
+
+    def get(self, session_id: str) -> TouristMemory:
+        with self._lock:
+            memory = self._memories.get(session_id)
+            if memory is not None:
+                self._memories.move_to_end(session_id)
+        if memory is not None:
+            memory.refresh()  # Another worker may have written it since
+            return memory
+        # Load outside the cache lock (file I/O); first one in wins
+        loaded = TouristMemory(session_id, write_behind=self.flush_interval > 0)
+        evicted = []
+        with self._lock:
+            memory = self._memories.setdefault(session_id, loaded)
+            self._memories.move_to_end(session_id)
+            while len(self._memories) > self.max_entries:
+                evicted.append(self._memories.popitem(last=False)[1])
+        for old in evicted:
+            old.flush()
+            old.write_behind = False  # Anyone still holding it writes through
+        self._ensure_flusher()
+        return memory
+
+    def discard(self, session_id: str):
+        """Evicts a deleted session without flushing it."""
+        with self._lock:
+            memory = self._memories.pop(session_id, None)
+        if memory is not None:
+            memory.forget()
+
+    def purge_inactive(self, before: str) -> int:
+        """GDPR sweep over the store; purged sessions also leave this worker's cache."""
+        session_ids = session_store.purge_inactive(before)
+        for session_id in session_ids:
+            self.discard(session_id)
+        return len(session_ids)
+
+    def flush_all(self) -> int:
+        """Persists every dirty session. Returns how many were written."""
+        with self._lock:
+            memories = list(self._memories.values())
+        return sum(1 for memory in memories if memory.flush())
+
+    def _ensure_flusher(self):
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush_all()
+            except Exception as e:
+                print(f"Session flush error: {e}")
+
+    def close(self):
+        """Stops the flusher and persists pending changes (app shutdown)."""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush_all()
+        self._stop.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            memories = list(self._memories.values())
+        return {"cached": len(memories), "dirty": sum(1 for m in memories if m.dirty)}
+
+
+def _create_session_store() -> SessionStore:
+    """SESSION_STORE=sqlite|json (ver config/.env.example)."""
+    from backend.core.config import get_settings
+    settings = get_settings()
+    if settings.SESSION_STORE == "json":
+        return JsonDirSessionStore(SESSIONS_DIR)
+    store = SqliteSessionStore(settings.SESSION_STORE_PATH or SESSIONS_DB_PATH)
+    try:
+        migrate_json_sessions(store, SESSIONS_DIR)
+    except Exception as e:
+        print(f"Error migrating sessions from {SESSIONS_DIR}: {e}")
+    return store
+
+
+session_store = _create_session_store()
+memory_cache = TouristMemoryCache()
 
 def get_tourist_memory(session_id: str) -> TouristMemory:
-    return TouristMemory(session_id)
+    return memory_cache.get(session_id)
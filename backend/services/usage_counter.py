@@ -1,11 +1,33 @@
+import asyncio
+import atexit
 import json
 import os
+import queue
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from typing import Dict, List, Optional
+from backend.services.usage_store import SqliteUsageStore
+from backend.services.usage_history import UsageHistory, UsageItem  # noqa: F401 (UsageItem re-exported)
 
+USAGE_STORE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "usage_v2.db")
+# Legacy JSON snapshot + append-only ledger, migrated into the store once
 USAGE_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "usage_v2.json")
+USAGE_LEDGER_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "usage_v2.ledger.jsonl")
+# Sessions kept in memory (loaded on demand, least recently used evicted)
+MAX_CACHED_SESSIONS = 2000
+# Raw usage items kept in memory per session (aggregates cover the rest)
+RECENT_HISTORY_SIZE = 50
+# Billing period (MONETIZATION_v2.md)
+PERIOD_DAYS = 7
+# Raw usage items older than this are pruned from the store (aggregates keep their sums)
+ITEM_RETENTION_DAYS = 30
+# Seconds between prune runs (in the background, triggered by writes)
+PRUNE_INTERVAL = 3600
+# Default window for enable_group_commit() (0 = every batch commits on its own)
+GROUP_COMMIT_WINDOW_MS = 20
 
 # Constants from MONETIZATION_v2.md
 COSTS = {
@@ -28,14 +50,6 @@ TIER_LIMITS = {
     }
 }
 
-@dataclass
-class UsageItem:
-    timestamp: float
-    service: str  # "elevenlabs", "claude", "weather", "maps", "places"
-    action: str   # "tts", "stt", "completion", "directions"
-    cost_eur: float
-    cached: bool = False
-
 @dataclass
 class SessionUsage:
     session_id: str
@@ -44,88 +58,310 @@ class SessionUsage:
     last_active: str = ""
     total_cost_eur: float = 0.0
     interaction_count: int = 0
-    history: List[UsageItem] = None
+    history: UsageHistory = None  # Most recent items only (RECENT_HISTORY_SIZE), the rest stays in the store
+    service_costs: Dict[str, float] = None  # Rolling lifetime aggregates per service
+    service_counts: Dict[str, int] = None
     
     def __post_init__(self):
         if self.history is None:
-            self.history = []
+            self.history = UsageHistory()
+        elif not isinstance(self.history, UsageHistory):
+            self.history = UsageHistory(self.history)
+        if self.service_costs is None:
+            self.service_costs = {}
+        if self.service_counts is None:
+            self.service_counts = {}
+
+def breakdown_group(service: str) -> str:
+    """Frontend breakdown bucket of a service."""
+    if service == "elevenlabs":
+        return "voice"
+    if service == "claude":
+        return "intelligence"
+    return "context"
+
+class UsageBatch:
+    """Collects the usage of one request; flushed by UsageCounterService._commit."""
+
+    def __init__(self, service: "UsageCounterService"):
+        self._service = service
+        self.entries: List[tuple] = []
+
+    def record_usage(self, session_id: str, service: str, action: str, cost: float = 0.0, cached: bool = False):
+        if session_id == "anonymous": return
+        self.entries.append((session_id, service, action, cost, cached))
+
+    def flush(self):
+        entries, self.entries = self.entries, []
+        self._service._commit(entries)
+
+    def __enter__(self) -> "UsageBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Usage already consumed is billed even if the request failed later
+        self.flush()
+        return False
+
+    async def __aenter__(self) -> "UsageBatch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # From async routes: the SQLite write (busy timeout included) runs off the event loop
+        await asyncio.to_thread(self.flush)
+        return False
+
+
+class GroupCommitter:
+    """
+    Optional group commit: a background thread drains the batches submitted
+    by concurrent requests and writes them in one transaction per window.
+    Totals become visible to get_session at most window_ms later.
+    """
+
+    def __init__(self, store: SqliteUsageStore, window_ms: float):
+        self.store = store
+        self.window = window_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="usage-group-commit", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, writes: List[tuple]):
+        self._queue.put(writes)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            writes = list(first)
+            deadline = time.monotonic() + self.window
+            stop = False
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    more = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                    break
+                writes.extend(more)
+            try:
+                self.store.write_batch(writes)
+            except Exception as e:
+                print(f"Error writing usage batch ({len(writes)} sessions): {e}")
+            if stop:
+                return
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
 
 class UsageCounterService:
-    def __init__(self):
-        self.db_path = USAGE_DB_PATH
-        self._ensure_db()
-        self._cache = {} # Simple memory cache to avoid too many reads
-        self.reload_db()
-
-    def _ensure_db(self):
-        if not os.path.exists(os.path.dirname(self.db_path)):
-            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        if not os.path.exists(self.db_path):
-            with open(self.db_path, "w") as f:
-                json.dump({"sessions": {}}, f)
-
-    def reload_db(self):
+    def __init__(self, store_path: str = USAGE_STORE_PATH):
+        self.store = SqliteUsageStore(store_path)
+        # LRU of sessions loaded on demand; the store is the source of truth
+        self._cache: "OrderedDict[str, SessionUsage]" = OrderedDict()
+        self._synced_upto: Dict[str, int] = {}  # session_id -> last item id loaded
+        self._lock = threading.RLock()
+        self.group_committer: Optional["GroupCommitter"] = None
+        self._last_prune = None  # monotonic time of the last prune run (None = not yet)
+        self._prune_lock = threading.Lock()
+        self._migrate_legacy_json()
+
+    def _migrate_legacy_json(self):
+        """One-off import of usage_v2.json (+ its ledger) into an empty store."""
+        if not os.path.exists(USAGE_DB_PATH) or not self.store.is_empty():
+            return
         try:
-            with open(self.db_path, "r") as f:
+            with open(USAGE_DB_PATH, "r") as f:
                 data = json.load(f)
-                self._cache = {
-                    sid: SessionUsage(**s_data) 
-                    for sid, s_data in data.get("sessions", {}).items()
-                }
-                # converting dict history to objects
-                for sid in self._cache:
-                    history_raw = self._cache[sid].history
-                    self._cache[sid].history = [UsageItem(**h) if isinstance(h, dict) else h for h in history_raw]
-        except Exception as e:
-            print(f"Error loading usage DB: {e}")
-            self._cache = {}
+            sessions = data.get("sessions", {})
+            after_seq = data.get("last_seq", 0)
+            if os.path.exists(USAGE_LEDGER_PATH):
+                with open(USAGE_LEDGER_PATH, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # Torn write
+                        if record.get("seq", 0) > after_seq:
+                            self._apply_legacy_record(sessions, record)
 
-    def save_db(self):
-        try:
-            data = {"sessions": {sid: asdict(usage) for sid, usage in self._cache.items()}}
-            with open(self.db_path, "w") as f:
-                json.dump(data, f, indent=2)
+            # One transaction, re-checked under the write lock: all or nothing, once across workers
+            imported = self.store.import_sessions(
+                ((sid, s_data.get("tier", "free"), s_data.get("created_at", ""), s_data.get("last_active", ""),
+                  s_data.get("total_cost_eur", 0.0), s_data.get("interaction_count", 0)),
+                 [(h["timestamp"], h["service"], h["action"], h["cost_eur"], h.get("cached", False))
+                  for h in s_data.get("history") or []])
+                for sid, s_data in sessions.items()
+            )
+            if imported is None:
+                return  # Another worker migrated first (and renames the files)
+            for path in (USAGE_DB_PATH, USAGE_LEDGER_PATH):
+                if os.path.exists(path):
+                    os.replace(path, path + ".migrated")
+            print(f"Usage: migrated {imported} sessions from {USAGE_DB_PATH}")
         except Exception as e:
-            print(f"Error saving usage DB: {e}")
+            print(f"Error migrating usage DB: {e}")
+
+    def _apply_legacy_record(self, sessions: dict, record: dict):
+        session = sessions.setdefault(record["sid"], {"history": []})
+        session.setdefault("history", [])
+        if record["op"] == "session":
+            session.update(created_at=record["created_at"], last_active=record["last_active"],
+                           tier=record.get("tier", "free"))
+        elif record["op"] == "tier":
+            session["tier"] = record["tier"]
+        elif record["op"] == "usage":
+            cost, cached = record["cost"], record.get("cached", False)
+            session["history"].append({"timestamp": record["ts"], "service": record["service"],
+                                       "action": record["action"], "cost_eur": cost, "cached": cached})
+            session["last_active"] = record["last_active"]
+            if not cached:
+                session["total_cost_eur"] = session.get("total_cost_eur", 0.0) + cost
+                if record["service"] in ["claude", "elevenlabs"]:
+                    session["interaction_count"] = session.get("interaction_count", 0) + 1
+
+    def _sync(self, session: SessionUsage, row) -> SessionUsage:
+        """
+        Refreshes totals and per-service aggregates from the store and loads the
+        items added since the last sync, keeping only the most recent ones.
+        """
+        _, session.tier, session.created_at, session.last_active, session.total_cost_eur, session.interaction_count = row
+        totals = self.store.get_service_totals(session.session_id)
+        session.service_costs = {service: cost for service, (cost, _) in totals.items()}
+        session.service_counts = {service: count for service, (_, count) in totals.items()}
+        for item_id, ts, service, action, cost, cached in self.store.get_items(
+                session.session_id, self._synced_upto.get(session.session_id, 0), limit=RECENT_HISTORY_SIZE):
+            session.history.add(ts, service, action, cost, bool(cached))
+            self._synced_upto[session.session_id] = item_id
+        session.history.keep_last(RECENT_HISTORY_SIZE)
+        return session
 
     def get_session(self, session_id: str) -> SessionUsage:
-        if session_id not in self._cache:
-            self._cache[session_id] = SessionUsage(
-                session_id=session_id,
-                created_at=datetime.now().isoformat(),
-                last_active=datetime.now().isoformat()
-            )
-        return self._cache[session_id]
+        with self._lock:
+            session = self._cache.get(session_id)
+            row = self.store.get_session(session_id)
+            if session is None:
+                session = SessionUsage(
+                    session_id=session_id,
+                    created_at=datetime.now().isoformat(),
+                    last_active=datetime.now().isoformat()
+                )
+                self._cache[session_id] = session
+                while len(self._cache) > MAX_CACHED_SESSIONS:
+                    evicted, _ = self._cache.popitem(last=False)
+                    self._synced_upto.pop(evicted, None)
+            self._cache.move_to_end(session_id)
+            # Unknown to the store: new session, persisted on its first write
+            return self._sync(session, row) if row else session
 
-    def record_usage(self, session_id: str, service: str, action: str, cost: float = 0.0, cached: bool = False):
-        if session_id == "anonymous": return
-        
-        session = self.get_session(session_id)
-        
+    def _ensure_persisted(self, session: SessionUsage):
+        self.store.create_session(session.session_id, session.tier, session.created_at, session.last_active)
+
+    def _price(self, service: str, action: str, cost: float, cached: bool) -> float:
         # Calculate cost if not provided defaults
         if cost == 0.0 and not cached:
             cost = COSTS.get(service, 0.002) # Default low cost
             if service == "elevenlabs" and action == "tts": cost = COSTS["tts"]
             if service == "claude": cost = COSTS["llm"]
-            
-        item = UsageItem(
-            timestamp=time.time(),
-            service=service,
-            action=action,
-            cost_eur=cost,
-            cached=cached
-        )
-        
-        session.history.append(item)
-        if not cached:
-            session.total_cost_eur += cost
-        
-        # Count interactions (roughly 1 interaction = 1 LLM or TTS request)
-        if service in ["claude", "elevenlabs"] and not cached:
-             session.interaction_count += 1
-             
-        session.last_active = datetime.now().isoformat()
-        self.save_db()
+        return cost
+
+    def record_usage(self, session_id: str, service: str, action: str, cost: float = 0.0, cached: bool = False):
+        """Records (and persists) a single usage item. Use batch() for several."""
+        with self.batch() as usage:
+            usage.record_usage(session_id, service, action, cost=cost, cached=cached)
+
+    def batch(self) -> "UsageBatch":
+        """
+        Request-scoped unit of work: every record_usage inside the block is
+        written in one transaction when the block exits. In async code use
+        "async with" so the write runs in a worker thread, not on the loop.
+
+            async with usage_counter.batch() as usage:
+                usage.record_usage(user_id, "claude", "completion")
+                usage.record_usage(user_id, "weather", "current_weather")
+        """
+        return UsageBatch(self)
+
+    def _maybe_prune(self):
+        """Tiers out raw items past ITEM_RETENTION_DAYS, at most once per PRUNE_INTERVAL."""
+        now = time.monotonic()
+        if self._last_prune is not None and now - self._last_prune < PRUNE_INTERVAL:
+            return
+        if not self._prune_lock.acquire(blocking=False):
+            return  # A prune is already running
+        self._last_prune = now
+        threading.Thread(target=self._prune, daemon=True).start()
+
+    def _prune(self):
+        try:
+            removed = self.store.prune_items(time.time() - ITEM_RETENTION_DAYS * 86400)
+            if removed:
+                print(f"Usage: pruned {removed} raw items older than {ITEM_RETENTION_DAYS} days")
+        except Exception as e:
+            print(f"Error pruning usage items: {e}")
+        finally:
+            self._prune_lock.release()
+
+    def _commit(self, entries: List[tuple]):
+        """
+        Persists a batch of (session_id, service, action, cost, cached).
+        Never raises: a usage-accounting failure is logged and must not fail the request.
+        """
+        try:
+            self._write_entries(entries)
+        except Exception as e:
+            print(f"Error writing usage batch ({len(entries)} items): {e}")
+
+    def _write_entries(self, entries: List[tuple]):
+        self._maybe_prune()
+        writes = OrderedDict()
+        now_iso = datetime.now().isoformat()
+        for session_id, service, action, cost, cached in entries:
+            if session_id not in writes:
+                session = self.get_session(session_id)
+                writes[session_id] = [session_id, session.tier, session.created_at, [], 0.0, 0, now_iso]
+            w = writes[session_id]
+            cost = self._price(service, action, cost, cached)
+            w[3].append((time.time(), service, action, cost, cached))
+            if not cached:
+                w[4] += cost
+            # Count interactions (roughly 1 interaction = 1 LLM or TTS request)
+            if service in ["claude", "elevenlabs"] and not cached:
+                w[5] += 1
+        if not writes:
+            return
+
+        writes = [tuple(w) for w in writes.values()]
+        if self.group_committer is not None:
+            # Shared transaction with other requests (within the commit window)
+            self.group_committer.submit(writes)
+            return
+        with self._lock:
+            self.store.write_batch(writes)
+            for w in writes:
+                session = self._cache.get(w[0])
+                if session is not None:
+                    self._sync(session, self.store.get_session(w[0]))
+
+    def enable_group_commit(self, window_ms: float = GROUP_COMMIT_WINDOW_MS):
+        """Batches from concurrent requests are written together every window_ms."""
+        if self.group_committer is None and window_ms > 0:
+            self.group_committer = GroupCommitter(self.store, window_ms)
+
+    def close(self):
+        """Flushes pending group commits (app shutdown)."""
+        if self.group_committer is not None:
+            self.group_committer.close()
+            self.group_committer = None
 
     def check_limit(self, session_id: str) -> dict:
         session = self.get_session(session_id)
@@ -146,21 +382,18 @@ class UsageCounterService:
         session = self.get_session(session_id)
         limits = TIER_LIMITS.get(session.tier, TIER_LIMITS["free"])
         
-        # Calculate Breakdown
+        # Calculate Breakdown (from the rolling per-service aggregates: O(services), not O(history))
         breakdown = {"voice": 0.0, "intelligence": 0.0, "context": 0.0}
+        for service, cost in session.service_costs.items():
+            breakdown[breakdown_group(service)] += cost
         
         # Determine Period (Last 7 days or since creation)
-        # For this MVP, we assume period starts at creation or is just lifetime for now
-        # MONETIZATION_v2.md says "Período: 7 días". We can calculate period_start as 7 days ago or creation.
-        # Simplification: Period Start = Created At.
-        
-        for item in session.history:
-            if item.service == "elevenlabs":
-                breakdown["voice"] += item.cost_eur
-            elif item.service == "claude":
-                breakdown["intelligence"] += item.cost_eur
-            else:
-                breakdown["context"] += item.cost_eur
+        # MONETIZATION_v2.md says "Período: 7 días": day buckets give the last 7 days.
+        # period_start stays Created At (lifetime) for the counter.
+        since_day = int(time.time() // 86400) - (PERIOD_DAYS - 1)
+        period_breakdown = {"voice": 0.0, "intelligence": 0.0, "context": 0.0}
+        for service, (cost, _) in self.store.get_daily_totals(session_id, since_day).items():
+            period_breakdown[breakdown_group(service)] += cost
                 
         is_limit_reached = False
         limit_val = limits["max_interactions"]
@@ -186,13 +419,19 @@ class UsageCounterService:
             "hold_amount": limits.get("hold_amount_eur", 0),
             "period_start": session.created_at,
             "period_end": period_end_date,
-            "breakdown": {k: round(v, 4) for k, v in breakdown.items()}
+            "breakdown": {k: round(v, 4) for k, v in breakdown.items()},
+            "last_7_days": {
+                "cost_eur": round(sum(period_breakdown.values()), 4),
+                "breakdown": {k: round(v, 4) for k, v in period_breakdown.items()}
+            }
         }
 
     def upgrade_user(self, session_id: str):
         session = self.get_session(session_id)
-        session.tier = "premium"
-        self.save_db()
+        with self._lock:
+            self._ensure_persisted(session)
+            self.store.set_tier(session_id, "premium")
+            session.tier = "premium"
         return session
 
 usage_counter = UsageCounterService()
@@ -0,0 +1,117 @@
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Union
+
+
+@dataclass
+class UsageItem:
+    timestamp: float
+    service: str  # "elevenlabs", "claude", "weather", "maps", "places"
+    action: str   # "tts", "stt", "completion", "directions"
+    cost_eur: float
+    cached: bool = False
+
+
+class _Interner:
+    """
+    Process-wide string <-> small int table for service/action names.
+    There are only a handful of distinct values, so every history stores
+    2-byte codes instead of its own str objects.
+    """
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(name)
+                if code is None:
+                    code = len(self._names)
+                    self._names.append(name)
+                    self._codes[name] = code
+        return code
+
+    def name(self, code: int) -> str:
+        return self._names[code]
+
+
+_interner = _Interner()
+
+
+class UsageHistory:
+    """
+    Columnar, list-like store of UsageItem: parallel typed arrays
+    (timestamp/cost float64, service/action uint16 codes, cached uint8)
+    instead of one dataclass instance per item. ~21 bytes per item.
+    Items are materialized as UsageItem only when read.
+    """
+
+    __slots__ = ("_ts", "_cost", "_service", "_action", "_cached")
+
+    def __init__(self, items: Iterable = ()):
+        self._ts = array("d")
+        self._cost = array("d")
+        self._service = array("H")
+        self._action = array("H")
+        self._cached = array("B")
+        for item in items:
+            self.append(item)
+
+    def add(self, timestamp: float, service: str, action: str, cost_eur: float, cached: bool = False):
+        self._ts.append(timestamp)
+        self._cost.append(cost_eur)
+        self._service.append(_interner.code(service))
+        self._action.append(_interner.code(action))
+        self._cached.append(1 if cached else 0)
+
+    def append(self, item: UsageItem):
+        self.add(item.timestamp, item.service, item.action, item.cost_eur, item.cached)
+
+    def _item(self, i: int) -> UsageItem:
+        return UsageItem(
+            timestamp=self._ts[i],
+            service=_interner.name(self._service[i]),
+            action=_interner.name(self._action[i]),
+            cost_eur=self._cost[i],
+            cached=bool(self._cached[i])
+        )
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def __iter__(self) -> Iterator[UsageItem]:
+        for i in range(len(self._ts)):
+            yield self._item(i)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self._item(i) for i in range(*index.indices(len(self._ts)))]
+        if index < 0:
+            index += len(self._ts)
+        if not 0 <= index < len(self._ts):
+            raise IndexError("usage history index out of range")
+        return self._item(index)
+
+    def __delitem__(self, index: Union[int, slice]):
+        for column in (self._ts, self._cost, self._service, self._action, self._cached):
+            del column[index]
+
+    def clear(self):
+        del self[:]
+
+    def keep_last(self, n: int):
+        """Drops all but the n most recent items."""
+        if len(self._ts) > n:
+            del self[:len(self._ts) - n]
+
+    def nbytes(self) -> int:
+        """Bytes used by the item data (array buffers)."""
+        return sum(c.itemsize * len(c) for c in (self._ts, self._cost, self._service, self._action, self._cached))
+
+    def __repr__(self) -> str:
+        return f"UsageHistory({len(self)} items)"
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (session_id, tier, created_at, last_active, total_cost_eur, interaction_count)
+SessionRow = Tuple[str, str, str, str, float, int]
+# (id, timestamp, service, action, cost_eur, cached)
+ItemRow = Tuple[int, float, str, str, float, int]
+# (timestamp, service, action, cost_eur, cached)
+NewItem = Tuple[float, str, str, float, bool]
+# (session_id, tier, created_at, items, cost_delta, interactions_delta, last_active)
+SessionWrite = Tuple[str, str, str, List[NewItem], float, int, str]
+
+# Rows deleted per transaction by prune_items
+PRUNE_CHUNK = 5000
+# prune_items uses its own connection: short busy timeout, then back off and retry
+PRUNE_BUSY_TIMEOUT = 0.2
+PRUNE_BACKOFF = 0.5
+PRUNE_MAX_BUSY_RETRIES = 10
+
+
+class SqliteUsageStore:
+    """
+    Storage engine for usage data: SQLite in WAL mode, so several uvicorn
+    workers can read and write the same file concurrently.
+    Items are only ever inserted (append-only); session totals are updated
+    in the same transaction with relative UPDATEs, so concurrent writers
+    never lose increments. Lookups go through the session_id indexes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints, safe on app crash
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                tier TEXT NOT NULL DEFAULT 'free',
+                created_at TEXT,
+                last_active TEXT,
+                total_cost_eur REAL NOT NULL DEFAULT 0,
+                interaction_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                timestamp REAL,
+                service TEXT,
+                action TEXT,
+                cost_eur REAL,
+                cached INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_items_session ON usage_items(session_id, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_items_timestamp ON usage_items(timestamp)")
+        # Rolling aggregates, maintained in the same transaction as the items
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage_totals (
+                session_id TEXT NOT NULL,
+                service TEXT NOT NULL,
+                cost_eur REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (session_id, service)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS usage_daily (
+                session_id TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                service TEXT NOT NULL,
+                cost_eur REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (session_id, day, service)
+            )
+        """)
+        self._backfill_aggregates()
+
+    def _backfill_aggregates(self):
+        """Stores created before the aggregate tables: build them once from the items."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM usage_totals LIMIT 1").fetchone():
+                return
+            if not self._conn.execute("SELECT 1 FROM usage_items LIMIT 1").fetchone():
+                return
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                # Another worker may have done it while we waited for the lock
+                if self._conn.execute("SELECT 1 FROM usage_totals LIMIT 1").fetchone():
+                    return
+                self._conn.execute(
+                    "INSERT INTO usage_totals (session_id, service, cost_eur, count) "
+                    "SELECT session_id, service, SUM(cost_eur), COUNT(*) FROM usage_items GROUP BY session_id, service"
+                )
+                self._conn.execute(
+                    "INSERT INTO usage_daily (session_id, day, service, cost_eur, count) "
+                    "SELECT session_id, CAST(timestamp / 86400 AS INTEGER), service, SUM(cost_eur), COUNT(*) "
+                    "FROM usage_items GROUP BY session_id, CAST(timestamp / 86400 AS INTEGER), service"
+                )
+
+    def _insert_items(self, session_id: str, items: List[NewItem]):
+        # Caller holds the lock, inside a transaction
+        self._conn.executemany(
+            "INSERT INTO usage_items (session_id, timestamp, service, action, cost_eur, cached) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(session_id, ts, service, action, cost, int(cached)) for ts, service, action, cost, cached in items]
+        )
+        self._conn.executemany(
+            "INSERT INTO usage_totals (session_id, service, cost_eur, count) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT (session_id, service) DO UPDATE SET "
+            "cost_eur = cost_eur + excluded.cost_eur, count = count + 1",
+            [(session_id, service, cost) for _, service, _, cost, _ in items]
+        )
+        self._conn.executemany(
+            "INSERT INTO usage_daily (session_id, day, service, cost_eur, count) VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT (session_id, day, service) DO UPDATE SET "
+            "cost_eur = cost_eur + excluded.cost_eur, count = count + 1",
+            [(session_id, int(ts // 86400), service, cost) for ts, service, _, cost, _ in items]
+        )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
+
+    def get_session(self, session_id: str) -> Optional[SessionRow]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT session_id, tier, created_at, last_active, total_cost_eur, interaction_count "
+                "FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+
+    def get_items(self, session_id: str, after_id: int = 0, limit: int = -1) -> List[ItemRow]:
+        """
+        Items of a session with id > after_id (incremental sync), oldest first.
+        With a limit, only the most recent ones.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, timestamp, service, action, cost_eur, cached FROM usage_items "
+                "WHERE session_id = ? AND id > ? ORDER BY id DESC LIMIT ?", (session_id, after_id, limit)
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def get_service_totals(self, session_id: str) -> Dict[str, Tuple[float, int]]:
+        """Lifetime {service: (cost_eur, count)} of a session."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT service, cost_eur, count FROM usage_totals WHERE session_id = ?", (session_id,)
+            ).fetchall()
+        return {service: (cost, count) for service, cost, count in rows}
+
+    def get_daily_totals(self, session_id: str, since_day: int) -> Dict[str, Tuple[float, int]]:
+        """{service: (cost_eur, count)} summed over the day buckets >= since_day (epoch days)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT service, SUM(cost_eur), SUM(count) FROM usage_daily "
+                "WHERE session_id = ? AND day >= ? GROUP BY service", (session_id, since_day)
+            ).fetchall()
+        return {service: (cost, count) for service, cost, count in rows}
+
+    def prune_items(self, before_ts: float, chunk: int = PRUNE_CHUNK) -> int:
+        """
+        Drops raw items older than before_ts. Totals and day buckets already
+        hold their sums, so stats are unaffected. Runs on its own connection
+        (never holds the shared lock the request path uses), one short
+        transaction per chunk, backing off while the database is busy.
+        """
+        removed = busy = 0
+        conn = sqlite3.connect(self.path, timeout=PRUNE_BUSY_TIMEOUT, isolation_level=None)
+        try:
+            while True:
+                try:
+                    n = conn.execute(
+                        "DELETE FROM usage_items WHERE id IN "
+                        "(SELECT id FROM usage_items WHERE timestamp < ? LIMIT ?)", (before_ts, chunk)
+                    ).rowcount
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e) and "busy" not in str(e):
+                        raise
+                    busy += 1
+                    if busy > PRUNE_MAX_BUSY_RETRIES:
+                        print(f"Usage prune: database busy, stopping after {removed} items (next run continues)")
+                        return removed
+                    time.sleep(PRUNE_BACKOFF * busy)
+                    continue
+                removed += n
+                if n < chunk:
+                    return removed
+        finally:
+            conn.close()
+
+    def create_session(self, session_id: str, tier: str, created_at: str, last_active: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, tier, created_at, last_active) VALUES (?, ?, ?, ?)",
+                (session_id, tier, created_at, last_active)
+            )
+
+    def write_batch(self, writes: Iterable[SessionWrite]):
+        """
+        Persists the usage of one or many sessions in a single transaction:
+        creates missing sessions, inserts the items and bumps the totals.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for session_id, tier, created_at, items, cost_delta, interactions_delta, last_active in writes:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO sessions (session_id, tier, created_at, last_active) VALUES (?, ?, ?, ?)",
+                        (session_id, tier, created_at, last_active)
+                    )
+                    self._insert_items(session_id, items)
+                    self._conn.execute(
+                        "UPDATE sessions SET total_cost_eur = total_cost_eur + ?, "
+                        "interaction_count = interaction_count + ?, last_active = ? WHERE session_id = ?",
+                        (cost_delta, interactions_delta, last_active, session_id)
+                    )
+
+    def set_tier(self, session_id: str, tier: str):
+        with self._lock:
+            self._conn.execute("UPDATE sessions SET tier = ? WHERE session_id = ?", (tier, session_id))
+
+    def import_sessions(self, sessions: Iterable[Tuple[SessionRow, Iterable[NewItem]]]) -> Optional[int]:
+        """
+        Bulk import (legacy JSON migration) of (row, items) pairs, as they
+        are, in one transaction: a crash imports nothing and the next start
+        retries. Only into an empty store, checked under the write lock so
+        concurrent workers import once. Returns the sessions imported, or
+        None if the store already had data.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                if self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone():
+                    return None
+                count = 0
+                for row, items in sessions:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sessions "
+                        "(session_id, tier, created_at, last_active, total_cost_eur, interaction_count) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", row
+                    )
+                    self._insert_items(row[0], list(items))
+                    count += 1
+                return count
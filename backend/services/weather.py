@@ -1,12 +1,32 @@
+import asyncio
 import os
+import time
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime
+from backend.services.cache import cache, CACHE_TTL
+from backend.services.http_client import use_client
+from backend.services.singleflight import SingleFlight
+
+# Older than this, real weather is not served anymore (mock instead)
+WEATHER_HARD_TTL = 3 * 3600
+# Max wait for a fetch when there is nothing cached to serve
+WEATHER_COLD_WAIT = 2.0
 
 class WeatherService:
     def __init__(self):
         self.api_key = os.getenv("OPENWEATHER_API_KEY")
         self.base_url = "https://api.openweathermap.org/data/2.5/weather"
+        self.soft_ttl = CACHE_TTL["weather"]
+        self.hard_ttl = WEATHER_HARD_TTL
+        self.cold_wait = WEATHER_COLD_WAIT
+        self._flight = SingleFlight()
+        self._background = set()  # Keeps refresh tasks referenced until done
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    def set_http_client(self, client: Optional[httpx.AsyncClient]):
+        """Injects the shared pooled client (app lifespan)."""
+        self.http_client = client
 
     def _get_mock_weather(self, city: str) -> Dict[str, Any]:
         """
@@ -56,35 +76,72 @@ class WeatherService:
         """
         Get current weather for a specific city.
         Returns normalized format: {city, temp, description, humidity}
+
+        Stale-while-revalidate: a value younger than the soft TTL is served as is;
+        between soft and hard TTL it is served right away and refreshed in the
+        background. With nothing usable (cold start or older than the hard TTL)
+        we wait briefly for a fetch and fall back to mock weather.
         """
         if not self.api_key:
             return self._get_mock_weather(city)
 
+        key = f"weather:{city.lower()}"
+        entry = cache.get(key)
+        if entry:
+            age = time.time() - entry["fetched_at"]
+            if age >= self.soft_ttl:
+                self._refresh_in_background(key, city)
+            return entry["data"]
+
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    self.base_url,
-                    params={
-                        "q": city,
-                        "appid": self.api_key,
-                        "units": "metric",
-                        "lang": "es"
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
-
-                # Normalize to simple format
-                return {
-                    "city": data.get("name", city),
-                    "temp": round(data["main"]["temp"]),
-                    "description": data["weather"][0]["description"],
-                    "humidity": data["main"]["humidity"],
-                    "mock": False
-                }
+            # Concurrent misses for the same city share a single upstream call
+            return await asyncio.wait_for(self._refresh(key, city), self.cold_wait)
         except Exception as e:
-            print(f"Error fetching weather: {e}")
+            # Timeout (the refresh keeps running) or upstream error
+            print(f"Weather unavailable for {city} ({e!r}), using mock")
             return self._get_mock_weather(city)
 
+    def _refresh(self, key: str, city: str):
+        return self._flight.do(key, lambda: self._fetch_and_store(key, city))
+
+    def _refresh_in_background(self, key: str, city: str):
+        task = asyncio.ensure_future(self._refresh(key, city))
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+
+    def _background_done(self, task: asyncio.Future):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Error refreshing weather: {task.exception()}")
+
+    async def _fetch_and_store(self, key: str, city: str) -> Dict[str, Any]:
+        weather = await self._fetch_weather(city)
+        # Hard TTL = lifetime of the cache entry
+        cache.set(key, {"data": weather, "fetched_at": time.time()}, self.hard_ttl)
+        return weather
+
+    async def _fetch_weather(self, city: str) -> Dict[str, Any]:
+        async with use_client(self.http_client) as client:
+            response = await client.get(
+                self.base_url,
+                params={
+                    "q": city,
+                    "appid": self.api_key,
+                    "units": "metric",
+                    "lang": "es"
+                }
+            )
+            response.raise_for_status()
+            data = response.json()
+
+            # Normalize to simple format
+            return {
+                "city": data.get("name", city),
+                "temp": round(data["main"]["temp"]),
+                "description": data["weather"][0]["description"],
+                "humidity": data["main"]["humidity"],
+                "mock": False
+            }
+
 # Singleton instance
 weather_service = WeatherService()
@@ -0,0 +1,101 @@
+"""
+Intent classifier benchmark: throughput of the compiled IntentClassifier
+vs the previous re.search loop, agreement between the two, and accuracy
+of both against a hand-labelled corpus (benchmarks/intent_corpus.tsv).
+
+    python -m benchmarks.intent_classifier [repeat]
+"""
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from backend.services.optimizer import TokenOptimizer
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "intent_corpus.tsv")
+
+# Previous implementation of TokenOptimizer.classify_intent, kept as the reference
+LEGACY_PATTERNS = {
+    "greeting": r"^(hola|hi|hello|buenos|buenas|hey|bonjour|ciao)",
+    "confirm": r"^(si|yes|ok|vale|genial|perfecto|sure|yep|da|oui)$",
+    "deny": r"^(no|nope|nan|non)$",
+    "repeat": r"^(repite|repeat|como|pardon|what)$",
+    "gratitude": r"^(gracias|thanks|merci|danke|grazie)"
+}
+
+
+def legacy_classify_intent(text: str) -> str:
+    for intent, pattern in LEGACY_PATTERNS.items():
+        if re.search(pattern, text, re.IGNORECASE):
+            return intent
+    high_cost_keywords = ["itinerario", "plan", "ruta", "dias", "comparar", "historia", "diferencia", "mejor opcion", "days", "trip"]
+    if any(k in text.lower() for k in high_cost_keywords):
+        return "high_cost"
+    if len(text.split()) > 15:
+        return "high_cost"
+    return "medium_cost"
+
+
+def load_corpus() -> list:
+    corpus = []
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            label, text = line.rstrip("\n").split("\t", 1)
+            corpus.append((label, text))
+    return corpus
+
+
+def throughput(fn, texts: list) -> float:
+    start = time.perf_counter()
+    fn(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    optimizer = TokenOptimizer()
+    corpus = load_corpus()
+    labels = [label for label, _ in corpus]
+    # Same input as in production: normalize_input before classifying
+    texts = [optimizer.normalize_input(text) for _, text in corpus]
+    raw_texts = [text for _, text in corpus]
+
+    legacy = [legacy_classify_intent(t) for t in texts]
+    compiled = [optimizer.classify_intent(t) for t in texts]
+    batch = optimizer.classify_many(raw_texts)
+    agree = sum(a == b for a, b in zip(legacy, compiled))
+    agree_raw = sum(legacy_classify_intent(t) == optimizer.classify_intent(t) for t in raw_texts)
+
+    print(f"corpus: {len(corpus)} labelled messages ({CORPUS_PATH})")
+    print(f"agreement compiled vs legacy: {agree}/{len(texts)} normalized, "
+          f"{agree_raw}/{len(raw_texts)} raw, classify_many == classify: {batch == compiled}")
+    for name, predicted in (("legacy", legacy), ("compiled", compiled)):
+        correct = sum(p == l for p, l in zip(predicted, labels))
+        print(f"accuracy vs labels ({name}): {correct}/{len(labels)} = {correct / len(labels):.1%}")
+    errors = Counter((l, p) for p, l in zip(compiled, labels) if p != l)
+    for (label, predicted), n in errors.most_common(5):
+        print(f"  {label} -> {predicted}: {n}")
+
+    workload = texts * repeat
+    legacy_rate = throughput(lambda ts: [legacy_classify_intent(t) for t in ts], workload)
+    compiled_rate = throughput(lambda ts: [optimizer.classify_intent(t) for t in ts], workload)
+    # Distinct texts (corpus message + a counter): no memo hits, the real batch cost
+    distinct = [f"{t} {i}" for i in range(repeat) for t in texts]
+    legacy_distinct_rate = throughput(lambda ts: [legacy_classify_intent(t) for t in ts], distinct)
+    batch_rate = throughput(optimizer.classifier.classify_many, distinct)
+    # Same corpus repeated: after the first pass every text is a memo hit
+    memo_rate = throughput(optimizer.classifier.classify_many, workload)
+    print(f"throughput ({len(workload)} messages, corpus repeated {repeat}x):")
+    print(f"  legacy re.search loop   {legacy_rate:12,.0f} msg/s")
+    print(f"  IntentClassifier        {compiled_rate:12,.0f} msg/s  ({compiled_rate / legacy_rate:.1f}x)")
+    print(f"  classify_many memo hits {memo_rate:12,.0f} msg/s  ({memo_rate / legacy_rate:.1f}x, cache-hit cost)")
+    print(f"throughput ({len(distinct)} distinct messages):")
+    print(f"  legacy re.search loop   {legacy_distinct_rate:12,.0f} msg/s")
+    print(f"  classify_many           {batch_rate:12,.0f} msg/s  ({batch_rate / legacy_distinct_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Memory benchmark: bytes per usage item, list of UsageItem dataclasses
+(previous SessionUsage.history) vs the columnar UsageHistory.
+
+    python -m benchmarks.usage_history_memory [items]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from backend.services.usage_history import UsageHistory, UsageItem
+
+SERVICES = [("claude", "completion"), ("elevenlabs", "tts"), ("elevenlabs", "stt"),
+            ("weather", "current_weather"), ("places", "search"), ("maps", "directions")]
+
+
+def make_rows(n: int):
+    rng = random.Random(42)
+    now = time.time()
+    for i in range(n):
+        service, action = rng.choice(SERVICES)
+        # Fresh str objects per row, like rows coming out of sqlite/json
+        yield now + i, service.encode().decode(), action.encode().decode(), rng.random() / 100, rng.random() < 0.2
+
+
+def measure(build, n: int) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    container = build(make_rows(n))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del container
+    return used
+
+
+def as_dataclasses(rows) -> list:
+    return [UsageItem(timestamp=ts, service=s, action=a, cost_eur=c, cached=k) for ts, s, a, c, k in rows]
+
+
+def as_columns(rows) -> UsageHistory:
+    history = UsageHistory()
+    for row in rows:
+        history.add(*row)
+    return history
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    before = measure(as_dataclasses, n)
+    after = measure(as_columns, n)
+    print(f"{n} items")
+    print(f"  list[UsageItem]  {before / n:8.1f} bytes/item  ({before / 1e6:.1f} MB)")
+    print(f"  UsageHistory     {after / n:8.1f} bytes/item  ({after / 1e6:.1f} MB)")
+    print(f"  reduction        {before / max(after, 1):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
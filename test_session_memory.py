@@ -0,0 +1,102 @@
+"""
+Regression tests for TouristMemory with several workers sharing one
+session store (run: python -m pytest test_session_memory.py).
+Each TouristMemoryCache stands for one uvicorn worker.
+"""
+import os
+import tempfile
+
+from backend.services import tourist_memory
+from backend.services.session_store import JsonDirSessionStore, SqliteSessionStore
+from backend.services.tourist_memory import TouristMemoryCache
+
+
+def _use_store(store):
+    previous = tourist_memory.session_store
+    tourist_memory.session_store = store
+    return previous
+
+
+def _two_workers(store):
+    previous = _use_store(store)
+    try:
+        worker_a = TouristMemoryCache(flush_interval=0)  # Write-through
+        worker_b = TouristMemoryCache(flush_interval=0)
+
+        # Both workers have the session cached (stale copies from here on)
+        worker_b.get("s1").add_interaction("user", "hola")
+        worker_a.get("s1").add_interaction("user", "me gusta el jazz")
+
+        memory_a = worker_a.get("s1")
+        memory_a.set_email("ana@example.com")
+        memory_a.set_tier("premium")
+
+        # Next turn lands on worker B: it must not write back its stale tier/email
+        worker_b.get("s1").add_interaction("user", "quiero ir a la playa")
+
+        stored = store.load("s1")
+        assert stored["tier"] == "premium"
+        assert stored["email"] == "ana@example.com"
+        assert [i["content"] for i in stored["interactions"]] == [
+            "hola", "me gusta el jazz", "quiero ir a la playa"
+        ]
+        assert stored["preferences"]["interests"] == ["music", "beach"]
+    finally:
+        _use_store(previous)
+
+
+def test_two_caches_sqlite_store():
+    _two_workers(SqliteSessionStore(os.path.join(tempfile.mkdtemp(), "sessions.db")))
+
+
+def test_two_caches_json_store():
+    _two_workers(JsonDirSessionStore(tempfile.mkdtemp()))
+
+
+def test_write_behind_conflict_replays_pending_changes():
+    store = SqliteSessionStore(os.path.join(tempfile.mkdtemp(), "sessions.db"))
+    previous = _use_store(store)
+    try:
+        worker_a = TouristMemoryCache(flush_interval=0)
+        worker_b = TouristMemoryCache(flush_interval=60)  # Write-behind, flushed by hand
+
+        memory_b = worker_b.get("s2")
+        memory_b.add_interaction("user", "busco museos")  # Dirty, not written yet
+
+        worker_a.get("s2").set_tier("premium")  # Another worker writes first
+
+        assert memory_b.flush()  # Conflict: reload + replay, then written
+        stored = store.load("s2")
+        assert stored["tier"] == "premium"
+        assert [i["content"] for i in stored["interactions"]] == ["busco museos"]
+        assert store.version("s2") == 2
+        worker_b.close()
+    finally:
+        _use_store(previous)
+
+
+def test_purge_inactive_evicts_cached_sessions():
+    store = SqliteSessionStore(os.path.join(tempfile.mkdtemp(), "sessions.db"))
+    previous = _use_store(store)
+    try:
+        cache = TouristMemoryCache(flush_interval=60)
+        memory = cache.get("old")
+        memory.add_interaction("user", "hola")
+        memory.flush()
+        memory.add_interaction("user", "sigo aquí")  # Dirty when the sweep runs
+
+        assert cache.purge_inactive("9999") == 1
+        assert cache.stats()["cached"] == 0
+        cache.flush_all()
+        assert store.load("old") is None  # Not written back
+        cache.close()
+    finally:
+        _use_store(previous)
+
+
+if __name__ == "__main__":
+    test_two_caches_sqlite_store()
+    test_two_caches_json_store()
+    test_write_behind_conflict_replays_pending_changes()
+    test_purge_inactive_evicts_cached_sessions()
+    print("PASS: session memory regression tests")